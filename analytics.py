@@ -0,0 +1,68 @@
+"""
+Dimensions for the daily consultation rollups: what one consultation adds to
+each dashboard counter. Used both when a consultation is written and by the
+backfill, so live and rebuilt counts agree.
+"""
+import re
+from datetime import date, datetime
+from typing import Iterator, Optional, Tuple
+
+from summaries import URGENCY_UNKNOWN
+from validators import BLOOD_GROUP_RE
+
+# Rollup dimensions; every consultation adds exactly one "total" and at least one symptom category
+DIMENSIONS = ("total", "symptom_category", "urgency", "age_band", "blood_group")
+
+UNKNOWN = URGENCY_UNKNOWN
+
+# A consultation counts once in every category its symptoms mention
+SYMPTOM_CATEGORIES = {
+    "respiratory": re.compile(
+        r"\b(cough\w*|breath\w*|wheez\w*|sore throat|throat|congest\w*|runny nose|sneez\w*|asthma|phlegm)\b", re.I),
+    "fever": re.compile(r"\b(fever\w*|temperature|chills?|shiver\w*)\b", re.I),
+    "gastrointestinal": re.compile(
+        r"\b(nause\w*|vomit\w*|diarrh\w*|stomach|abdomen|abdominal|constipat\w*|indigestion|heartburn|bloat\w*)\b",
+        re.I),
+    "neurological": re.compile(r"\b(headaches?|migraines?|dizz\w*|faint\w*|numb\w*|seizures?|confus\w*)\b", re.I),
+    "cardiovascular": re.compile(r"\b(chest pain|palpitations?|heart\w*)\b", re.I),
+    "musculoskeletal": re.compile(r"\b(back pain|joint\w*|muscle\w*|sprain\w*|swollen (ankle|knee)s?|arthritis)\b",
+                                  re.I),
+    "skin": re.compile(r"\b(rash\w*|itch\w*|hives|blisters?|acne|eczema)\b", re.I),
+    "mental_health": re.compile(r"\b(anxi\w*|depress\w*|stress\w*|insomnia|panic|low mood)\b", re.I),
+}
+OTHER_CATEGORY = "other"
+
+# (upper bound exclusive, label)
+AGE_BANDS = ((18, "0-17"), (30, "18-29"), (45, "30-44"), (60, "45-59"), (75, "60-74"), (200, "75+"))
+
+def symptom_categories(symptoms: Optional[str]) -> Tuple[str, ...]:
+    categories = tuple(name for name, pattern in SYMPTOM_CATEGORIES.items() if pattern.search(symptoms or ""))
+    return categories or (OTHER_CATEGORY,)
+
+def age_band(age: Optional[int]) -> str:
+    if age is None or age <= 0:
+        return UNKNOWN
+    for upper, label in AGE_BANDS:
+        if age < upper:
+            return label
+    return UNKNOWN
+
+def blood_group(answer: Optional[str]) -> str:
+    """Normalise free-text answers like "o positive" or "AB -ve" to A+/O-/...; anything else is unknown."""
+    match = BLOOD_GROUP_RE.match((answer or "").strip())
+    if not match or not match.group(3):
+        return UNKNOWN
+    sign = "-" if match.group(3).lower().startswith(("-", "neg")) else "+"
+    return match.group(2).upper() + sign
+
+def rollup_keys(consultation_date: datetime, symptoms: Optional[str], age: Optional[int],
+                blood_group_answer: Optional[str], urgency: Optional[str] = None) -> Iterator[Tuple[date, str, str]]:
+    """The (day, dimension, value) counters one consultation increments."""
+    day = consultation_date.date()
+    yield day, "total", ""
+    for category in symptom_categories(symptoms):
+        yield day, "symptom_category", category
+    # Consultations stored before urgency was tracked have none
+    yield day, "urgency", urgency or UNKNOWN
+    yield day, "age_band", age_band(age)
+    yield day, "blood_group", blood_group(blood_group_answer)
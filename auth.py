@@ -0,0 +1,13 @@
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from config import ADMIN_API_KEY
+
+def require_api_key(x_api_key: Optional[str] = Header(None)):
+    """Dependency for clinician/ops endpoints: the X-API-Key header must match ADMIN_API_KEY."""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=503, detail="ADMIN_API_KEY is not configured")
+    if not x_api_key or not hmac.compare_digest(x_api_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid API key")
@@ -0,0 +1,52 @@
+"""
+Rebuild the daily analytics rollups from consultation history.
+
+Run once after deploying rollups (consultations written before then aren't
+counted) and whenever the rollup rules in analytics.py change. Consultations are
+read in keyset chunks and only the counters are kept in memory, so memory grows
+with days x dimension values, not with the number of consultations. Each
+consultation is counted from the age, blood group and urgency stored with it, so
+a rebuilt day matches what live writes counted; consultations saved before those
+columns existed count as unknown. Only closed days (before --until, default today
+UTC) are replaced, all in one transaction; today's counters keep being maintained
+by live writes.
+
+    python backfill_rollups.py
+    python backfill_rollups.py --until 2024-06-01 --chunk-size 10000
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import date, datetime
+
+from analytics import rollup_keys
+from config import BACKFILL_CHUNK_SIZE
+from db import db_manager, init_db
+
+def backfill(until: date, chunk_size: int) -> Counter:
+    counts = Counter()
+    consultations = 0
+    started = time.perf_counter()
+    # The whole history is read before anything is written, so readers never see a half-rebuilt day
+    for rows in db_manager.iter_rollup_sources(until, chunk_size):
+        for _, consultation_date, symptoms, age, blood_group, urgency in rows:
+            counts.update(rollup_keys(consultation_date, symptoms, age, blood_group, urgency))
+        consultations += len(rows)
+        print(f"Read {consultations} consultations ({consultations / (time.perf_counter() - started):.0f}/s)")
+
+    written = asyncio.run(db_manager.replace_rollups(counts, until))
+    days = len({day for day, _, _ in counts})
+    print(f"Rebuilt {written} counters over {days} days from {consultations} consultations "
+          f"in {time.perf_counter() - started:.1f}s")
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the daily consultation rollups from history")
+    parser.add_argument("--until", type=date.fromisoformat, default=datetime.utcnow().date(),
+                        help="rebuild days before this date (YYYY-MM-DD, default today UTC)")
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE, help="consultations per fetch")
+    args = parser.parse_args()
+
+    init_db()
+    backfill(args.until, args.chunk_size)
@@ -0,0 +1,71 @@
+"""Offline stand-ins for Gemini, SendGrid and Twilio used by the benchmarks."""
+import asyncio
+import random
+from urllib.parse import parse_qs
+
+import httpx
+
+from model_router import OfflineLLM
+
+class FakeLLM:
+    """OfflineLLM replies after a configurable, jittered delay, optionally failing at random."""
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1, failure_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.offline = OfflineLLM()
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.failure_rate:
+            raise RuntimeError("fake LLM failure")
+        return await self.offline.ainvoke(messages)
+
+class FakeSendGrid:
+    """httpx transport that accepts every mail/send request after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.05, status_code: int = 202):
+        self.latency = latency
+        self.status_code = status_code
+        self.sent = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        return httpx.Response(self.status_code)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+class FakeTwilio:
+    """
+    httpx transport standing in for the Twilio Messages API. Answers each
+    Messages.json POST after `latency` seconds; a `throttle_rate` share of requests
+    get a 429 (Twilio's too-many-requests response) so retries are exercised.
+    """
+
+    def __init__(self, latency: float = 0.02, throttle_rate: float = 0.0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.sent = []
+        self.throttled = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency)
+        if not request.url.path.endswith("/Messages.json"):
+            return httpx.Response(404)
+        if random.random() < self.throttle_rate:
+            self.throttled += 1
+            return httpx.Response(429, json={"code": 20429, "message": "Too Many Requests"})
+        form = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+        self.sent.append((form["To"].removeprefix("whatsapp:"), form["Body"]))
+        return httpx.Response(201, json={"sid": f"SM{len(self.sent):032d}", "status": "queued"})
+
+    def recipients(self) -> set:
+        return {to for to, _ in self.sent}
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
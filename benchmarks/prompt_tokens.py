@@ -0,0 +1,96 @@
+"""
+Estimated prompt size per LLM call type: the previous full-question, indented-JSON
+prompts against the compact, budgeted prompts built by `prompts.PromptBuilder`.
+
+    python benchmarks/prompt_tokens.py
+    python benchmarks/prompt_tokens.py --long-answers   # verbose patient, budgets kick in
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from webhook_bench import ANSWERS, configure_environment
+
+# A typical free-text patient summary, which the two-call path feeds into the doctor prompt
+PATIENT_SUMMARY = (
+    "You have had a headache and mild fever for two days. This is most likely a common viral "
+    "infection. Rest, drink plenty of fluids and keep taking paracetamol as directed. Immediate "
+    "medical attention is not needed, but see a doctor if the fever rises above 39C or lasts more "
+    "than three days, or if you develop a stiff neck, confusion or a rash. "
+) * 2
+
+# Prompts as they were rendered before the budgeting layer
+LEGACY_PATIENT = """
+            Based on this consultation, provide:
+            1. Brief summary of condition
+            2. Basic recommendations
+            3. Whether immediate medical attention is needed
+
+            Details: {details}
+
+            Keep it simple and clear.
+            """
+LEGACY_DOCTOR = """
+            Create a clinical summary:
+            1. Patient condition overview
+            2. Key symptoms and duration
+            3. Relevant medical history
+            4. Recommendations
+
+            Patient Details: {details}
+            Patient Summary: {patient_summary}
+            """
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--long-answers", action="store_true", help="use multi-paragraph symptom and history answers")
+    args = parser.parse_args()
+
+    configure_environment(os.path.join(tempfile.mkdtemp(prefix="prompt-bench-"), "bench.db"))
+    import main
+    from prompts import estimate_tokens
+    from summaries import STRUCTURED_SUMMARY_PROMPT
+
+    answers = list(ANSWERS)
+    if args.long_answers:
+        answers[4] = "Throbbing headache behind my eyes, worse in the mornings, with chills and sweating. " * 12
+        answers[7] = "Appendix removed in 2009, asthma as a child, a broken wrist in 2015 that needed surgery. " * 8
+    session = main.ChatSession()
+    session.answers = {step.id: answer for step, answer in zip(session.questionnaire.steps, answers)}
+    # Before: answers under the full question text; after: under the questionnaire's short keys
+    details = json.dumps(session.questionnaire.labelled(session.answers), indent=2)
+    keyed = session.questionnaire.keyed(session.answers)
+    question, answer = session.questionnaire.steps[3].question, answers[3]
+
+    builder = main.prompt_builder
+    rows = [
+        ("validation",
+         main.VALIDATION_PROMPT.format(question=question, answer=answer),
+         builder.render("validation", main.VALIDATION_PROMPT, question=question, answer=answer)),
+        ("summary_structured",
+         STRUCTURED_SUMMARY_PROMPT.format(details=details),
+         builder.render("summary_structured", STRUCTURED_SUMMARY_PROMPT, keyed)),
+        ("summary_patient",
+         LEGACY_PATIENT.format(details=details),
+         builder.render("summary_patient", LEGACY_PATIENT, keyed)),
+        ("summary_doctor",
+         LEGACY_DOCTOR.format(details=details, patient_summary=PATIENT_SUMMARY),
+         builder.render("summary_doctor", LEGACY_DOCTOR, keyed, patient_summary=PATIENT_SUMMARY)),
+    ]
+
+    legacy_system = estimate_tokens(main.SYSTEM_PROMPT)
+    compact_system = estimate_tokens(builder.system_prompt)
+    print(f"{'call type':<20} {'before':>8} {'after':>8} {'saved':>7}")
+    for call_type, legacy, compact in rows:
+        before = legacy_system + estimate_tokens(legacy)
+        after = compact_system + estimate_tokens(compact)
+        print(f"{call_type:<20} {before:>8} {after:>8} {100 * (before - after) / before:>6.1f}%")
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,97 @@
+"""
+Daily analytics rollups at scale, on SQLite.
+
+Loads N synthetic consultations spread over --days days into a temporary
+database, rebuilds the rollups with the backfill (reporting its throughput and
+peak memory), then times a 30-day dashboard query on the rollup table against
+the same totals computed by scanning consultations with GROUP BY, which is what
+a dashboard cost without rollups.
+
+    python benchmarks/rollup_bench.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search_bench import consultation, time_queries
+
+BLOOD_GROUPS = ["A+", "A-", "B positive", "O +ve", "AB negative", "o positive", "don't know"]
+URGENCIES = ["routine", "routine", "routine", "soon", "immediate", "unknown"]
+
+def load(db_module, rows: int, patients: int, days: int, chunk: int, seed: int = 7):
+    from sqlalchemy import insert
+
+    rng = random.Random(seed)
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    profiles = [{"name": f"Patient {i}", "mobile_number": f"+1555{i:07d}", "age": rng.randint(1, 90),
+                 "blood_group": rng.choice(BLOOD_GROUPS)} for i in range(patients)]
+    with db_module.db_manager.get_db() as db:
+        db.execute(insert(db_module.Patient), profiles)
+        for offset in range(0, rows, chunk):
+            batch = [consultation(rng, rng.randint(1, patients)) for _ in range(min(chunk, rows - offset))]
+            for i, row in enumerate(batch):
+                # Consultations spread evenly over the period, in insertion order
+                row["consultation_date"] = start + timedelta(seconds=(offset + i) * days * 86400 // rows)
+                profile = profiles[row["patient_id"] - 1]
+                row["patient_age"] = profile["age"]
+                row["patient_blood_group"] = profile["blood_group"]
+                row["urgency"] = rng.choice(URGENCIES)
+            db.execute(insert(db_module.Consultation), batch)
+            db.commit()
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="consultations to load")
+    parser.add_argument("--patients", type=int, default=50_000)
+    parser.add_argument("--days", type=int, default=365, help="days of history the consultations span")
+    parser.add_argument("--range", type=int, default=30, help="days covered by the timed dashboard query")
+    parser.add_argument("--chunk", type=int, default=5_000, help="consultations per write and per backfill fetch")
+    parser.add_argument("--repeats", type=int, default=20, help="timed runs of the dashboard query")
+    parser.add_argument("--scan-repeats", type=int, default=3, help="timed runs of the GROUP BY scan")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'rollups.db')}"
+        import db as db_module
+        from analytics import DIMENSIONS
+        from backfill_rollups import backfill
+        from sqlalchemy import func
+
+        db_module.init_db()
+        load(db_module, args.rows, args.patients, args.days, args.chunk)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        started = time.perf_counter()
+        counts = backfill(datetime.utcnow().date(), args.chunk)
+        elapsed = time.perf_counter() - started
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"\nbackfill: {args.rows:,} consultations in {elapsed:.1f}s ({args.rows / elapsed:,.0f}/s), "
+              f"{len(counts):,} counters, peak RSS {rss_before:,.0f} -> {rss_after:,.0f} MB")
+
+        end = datetime.utcnow().date() - timedelta(days=1)
+        start = end - timedelta(days=args.range - 1)
+        Consultation = db_module.Consultation
+        with db_module.db_manager.get_db() as db:
+            rollup = time_queries(lambda: db_module.db_manager._daily_rollups(db, start, end, DIMENSIONS),
+                                  args.repeats)
+            day = func.date(Consultation.consultation_date)
+            scan = time_queries(lambda: db.query(day, func.count()).filter(
+                Consultation.consultation_date >= datetime.combine(start, datetime.min.time()),
+                Consultation.consultation_date < datetime.combine(end + timedelta(days=1), datetime.min.time())
+            ).group_by(day).all(), args.scan_repeats)
+
+        print(f"{args.range}-day dashboard: rollups p50 {rollup['p50_ms']:.1f} ms ({rollup['hits']} counters, "
+              f"every dimension); GROUP BY scan p50 {scan['p50_ms']:.1f} ms (totals only, {scan['hits']} days); "
+              f"{scan['p50_ms'] / rollup['p50_ms']:.1f}x")
+
+if __name__ == "__main__":
+    cli()
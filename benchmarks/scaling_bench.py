@@ -0,0 +1,115 @@
+"""
+Throughput of the production launcher (service.py --production) as workers are added.
+
+For each worker count, starts the dispatcher and workers on a local port with the
+offline LLM and a temporary SQLite database, then replays conversations from many
+senders over real HTTP. Each conversation stops before the last question so no
+outbound Twilio or SendGrid traffic is generated; this measures the webhook path.
+
+    python benchmarks/scaling_bench.py --workers 1,2,4 --senders 400 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from webhook_bench import ANSWERS, configure_environment, percentile
+
+BUSY_MARKER = "handling a lot of messages"
+
+async def wait_ready(client, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/dispatcher/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("service did not become ready")
+
+async def drive(port: int, senders: int, concurrency: int, offset: int) -> dict:
+    import httpx
+
+    latencies = []
+    shed = 0
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        await wait_ready(client, 60)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def conversation(n):
+            nonlocal shed, errors
+            sender = f"whatsapp:+1555{offset + n:07d}"
+            async with semaphore:
+                for i, body in enumerate(["Hi"] + ANSWERS[:-1]):
+                    started = time.perf_counter()
+                    response = await client.post("/webhook", data={
+                        "From": sender, "Body": body, "MessageSid": f"SM{offset + n:07d}{i:02d}"
+                    })
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        errors += 1
+                    elif BUSY_MARKER in response.text:
+                        shed += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(conversation(n) for n in range(senders)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "shed": shed,
+        "errors": errors,
+    }
+
+def run(workers: int, args) -> dict:
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "service.py"), "--production",
+         "--workers", str(workers), "--port", str(args.port)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        # Warm-up round so worker startup and first-use client construction aren't measured
+        asyncio.run(drive(args.port, min(args.senders, 20), args.concurrency, offset=9_000_000))
+        return asyncio.run(drive(args.port, args.senders, args.concurrency, offset=workers * 100_000))
+    finally:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts to compare")
+    parser.add_argument("--senders", type=int, default=400, help="conversations per run")
+    parser.add_argument("--concurrency", type=int, default=64, help="conversations in flight at once")
+    parser.add_argument("--port", type=int, default=5091)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(os.path.join(tmp, "bench.db"))
+        os.environ["SESSION_STORE"] = "memory"
+        results = [(int(w), run(int(w), args)) for w in args.workers.split(",")]
+
+    print(f"cpu cores: {os.cpu_count()}")
+    print(f"{'workers':>8} {'req/s':>9} {'speedup':>8} {'p50 ms':>9} {'p95 ms':>9} {'shed':>6} {'errors':>7}")
+    base = results[0][1]["requests_per_second"] or 1
+    for workers, r in results:
+        print(f"{workers:>8} {r['requests_per_second']:>9} {r['requests_per_second'] / base:>7.2f}x "
+              f"{r['latency_p50_ms']:>9} {r['latency_p95_ms']:>9} {r['shed']:>6} {r['errors']:>7}")
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,178 @@
+"""
+Full-text consultation search at scale, on the SQLite FTS5 backend.
+
+Loads N synthetic consultations into a temporary SQLite database, keeping the
+search index up to date chunk by chunk through the same path the app uses on
+every write. It reports the write cost of that index maintenance, then times
+first-page ranked searches (with the default rank window and ranking every
+match) against a LIKE scan over the three text columns, which is what a search
+cost before the index existed.
+
+    python benchmarks/search_bench.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from webhook_bench import percentile
+
+SYMPTOMS = [
+    "fever", "dry cough", "productive cough", "headache", "migraine", "sore throat", "runny nose",
+    "chest pain", "shortness of breath", "nausea", "vomiting", "diarrhoea", "abdominal pain",
+    "back pain", "joint pain", "rash", "itching", "dizziness", "fatigue", "insomnia", "palpitations",
+    "blurred vision", "ear pain", "toothache", "swollen ankles", "burning urination", "loss of smell",
+]
+RARE_SYMPTOMS = ["haemoptysis", "photophobia", "tinnitus", "hiccups", "jaundice"]
+DIAGNOSES = [
+    "viral upper respiratory infection", "tension headache", "gastroenteritis", "migraine without aura",
+    "allergic rhinitis", "musculoskeletal strain", "urinary tract infection", "anxiety", "dehydration",
+    "possible asthma exacerbation", "contact dermatitis", "acid reflux", "otitis media",
+]
+ADVICE = [
+    "Rest and drink plenty of fluids.", "Take paracetamol for pain and fever.",
+    "See a doctor if symptoms get worse.", "Seek urgent care if breathing becomes difficult.",
+    "Avoid known triggers and keep a symptom diary.", "Book a routine appointment this week.",
+]
+
+QUERIES = {
+    "common word": "fever",
+    "two words": "cough fever",
+    "phrase": '"shortness of breath"',
+    "diagnosis": "gastroenteritis",
+    "rare word": "haemoptysis",
+    "stemmed": "coughing",
+}
+
+def consultation(rng: random.Random, patient_id: int) -> dict:
+    symptoms = rng.sample(SYMPTOMS, rng.randint(1, 3))
+    if rng.random() < 0.001:
+        symptoms.append(rng.choice(RARE_SYMPTOMS))
+    diagnosis = rng.choice(DIAGNOSES)
+    return {
+        "patient_id": patient_id,
+        "symptoms": " and ".join(symptoms),
+        "symptoms_duration": f"{rng.randint(1, 14)} days",
+        "patient_summary": f"You reported {', '.join(symptoms)}. {rng.choice(ADVICE)}",
+        "doctor_summary": f"Presents with {', '.join(symptoms)}. Likely {diagnosis}. {rng.choice(ADVICE)}",
+    }
+
+def load(db_module, rows: int, patients: int, chunk: int, indexed: bool, seed: int = 7) -> float:
+    """Insert `rows` consultations; returns seconds spent writing them (patients excluded)."""
+    from sqlalchemy import insert
+
+    rng = random.Random(seed)
+    elapsed = 0.0
+    with db_module.db_manager.get_db() as db:
+        existing = db.query(db_module.Patient.id).count()
+        if existing < patients:
+            db.execute(insert(db_module.Patient), [
+                {"name": f"Patient {i}", "mobile_number": f"+1555{i:07d}", "age": 20 + i % 60}
+                for i in range(existing, patients)
+            ])
+            db.commit()
+        next_id = (db.query(db_module.func.max(db_module.Consultation.id)).scalar() or 0) + 1
+        for start in range(0, rows, chunk):
+            batch = [consultation(rng, rng.randint(1, patients)) for _ in range(min(chunk, rows - start))]
+            for offset, row in enumerate(batch):
+                row["id"] = next_id + offset
+            next_id += len(batch)
+            started = time.perf_counter()
+            db.execute(insert(db_module.Consultation), batch)
+            if indexed:
+                db_module.db_manager._index_for_search(db, batch)
+            db.commit()
+            elapsed += time.perf_counter() - started
+    return elapsed
+
+def like_scan(db, terms, limit):
+    from sqlalchemy import and_, or_
+    from db import Consultation
+
+    columns = (Consultation.symptoms, Consultation.patient_summary, Consultation.doctor_summary)
+    conditions = [or_(*(column.like(f"%{term}%") for column in columns)) for term in terms]
+    return db.query(Consultation.id).filter(and_(*conditions)).order_by(Consultation.id.desc()).limit(limit).all()
+
+def time_queries(fn, repeats: int) -> dict:
+    timings = []
+    hits = 0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        hits = len(fn())
+        timings.append(time.perf_counter() - started)
+    return {"p50_ms": percentile(timings, 50) * 1000, "p95_ms": percentile(timings, 95) * 1000, "hits": hits}
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="consultations to load")
+    parser.add_argument("--patients", type=int, default=50_000)
+    parser.add_argument("--chunk", type=int, default=5_000, help="consultations per write transaction")
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    parser.add_argument("--repeats", type=int, default=20, help="timed runs per search query")
+    parser.add_argument("--scan-repeats", type=int, default=3, help="timed runs per LIKE scan")
+    parser.add_argument("--rank-window", type=int, default=10_000, help="SEARCH_RANK_WINDOW to time")
+    parser.add_argument("--overhead-rows", type=int, default=100_000,
+                        help="rows loaded into fresh databases with and without the index to measure write overhead")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'search.db')}"
+        import db as db_module
+        from history import decode_search_cursor, encode_search_cursor
+        from search_index import parse_terms
+
+        db_module.init_db()
+        load_seconds = load(db_module, args.rows, args.patients, args.chunk, indexed=True)
+        print(f"loaded {args.rows:,} consultations with incremental indexing in {load_seconds:.1f}s "
+              f"({args.rows / load_seconds:,.0f} rows/s)")
+        print(f"database size: {os.path.getsize(os.path.join(tmp, 'search.db')) / 1e6:,.0f} MB")
+
+        # Write overhead: the same chunked load into two fresh databases, with and without the index
+        if args.overhead_rows:
+            from sqlalchemy import create_engine
+
+            rates = {}
+            saved_engine = db_module._engine
+            for indexed in (False, True):
+                db_module._engine = create_engine(f"sqlite:///{os.path.join(tmp, f'overhead-{indexed}.db')}")
+                db_module.init_db()
+                rates[indexed] = args.overhead_rows / load(db_module, args.overhead_rows, args.patients,
+                                                           args.chunk, indexed=indexed)
+            db_module._engine = saved_engine
+            print(f"write overhead at {args.overhead_rows:,} rows: {rates[False]:,.0f} rows/s without the index, "
+                  f"{rates[True]:,.0f} rows/s with it ({rates[False] / rates[True]:.2f}x time per write)")
+
+        print(f"\n{'query':<14} {'hits':>6} {'fts p50 ms':>11} {'fts p95 ms':>11} {'page 5 ms':>10} "
+              f"{'rank-all ms':>12} {'scan p50 ms':>12} {'speedup':>8}")
+        with db_module.db_manager.get_db() as db:
+            for label, query in QUERIES.items():
+                terms = parse_terms(query)
+                def search(after=None, rank_window=args.rank_window):
+                    return db_module.db_manager._search_consultations(db, terms, args.limit, after,
+                                                                      rank_window=rank_window)
+
+                fts = time_queries(search, args.repeats)
+                rank_all = time_queries(lambda: search(rank_window=0), args.scan_repeats)
+
+                # Walk to the fifth page through cursors, as a client paging through results would
+                after = None
+                for _ in range(4):
+                    page = search(after)
+                    if not page:
+                        break
+                    after = decode_search_cursor(encode_search_cursor(page[-1].score, page[-1].consultation_id))
+                deep = time_queries(lambda: search(after), args.repeats)
+
+                scan = time_queries(lambda: like_scan(db, terms, args.limit), args.scan_repeats)
+                print(f"{label:<14} {fts['hits']:>6} {fts['p50_ms']:>11.1f} {fts['p95_ms']:>11.1f} "
+                      f"{deep['p50_ms']:>10.1f} {rank_all['p50_ms']:>12.1f} {scan['p50_ms']:>12.1f} "
+                      f"{scan['p50_ms'] / fts['p50_ms']:>7.1f}x")
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,60 @@
+"""
+Memory held by in-progress ChatSessions in the in-process session store.
+
+Creates N concurrent sessions, each part-way through the questionnaire, and
+reports the traced Python heap per session plus the serialized size used by the
+shared SQLite store.
+
+    python benchmarks/session_memory.py --sessions 100000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from webhook_bench import ANSWERS, configure_environment
+
+async def fill_store(main, store, sessions: int, answered: int):
+    for i in range(sessions):
+        session = main.ChatSession()
+        for step, answer in zip(session.questionnaire.steps[:answered], ANSWERS):
+            # Answers arrive as fresh strings from the webhook form, never shared
+            session.answers[step.id] = "".join(answer)
+        session.advance()
+        await store.save(f"+1555{i:07d}", session)
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--answered", type=int, default=5, help="questions answered per session")
+    args = parser.parse_args()
+
+    configure_environment(os.path.join(tempfile.mkdtemp(prefix="session-bench-"), "bench.db"))
+    import main
+    from session_store import MemorySessionStore
+
+    store = MemorySessionStore(max_sessions=args.sessions, ttl=3600)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    asyncio.run(fill_store(main, store, args.sessions, args.answered))
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    sample = asyncio.run(store.get("+15550000000"))
+    print(f"sessions:            {len(store)}")
+    print(f"answered questions:  {args.answered}")
+    print(f"heap total:          {total / 1024 / 1024:.1f} MiB")
+    print(f"bytes per session:   {total / args.sessions:.0f}  (store entry and sender key included)")
+    print(f"serialized state:    {len(sample.dumps())} bytes")
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,213 @@
+"""
+Replay benchmark for the /webhook flow.
+
+Drives complete consultations from many simulated WhatsApp senders against the
+FastAPI app in-process, with Gemini, SendGrid and Twilio replaced by fakes and
+MySQL replaced by a temporary SQLite file.
+
+    python benchmarks/webhook_bench.py --senders 200 --llm-latency 0.3
+    python benchmarks/webhook_bench.py --save-baseline       # record benchmarks/baseline.json
+    python benchmarks/webhook_bench.py --max-regression 15   # exit 1 if p95/throughput regress >15%
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# One full consultation; the name, allergy and medication answers need the LLM relevance check
+ANSWERS = [
+    "Alice Smith",
+    "34 years",
+    "O+",
+    "Peanuts and dust",
+    "Headache and mild fever",
+    "2 days",
+    "Paracetamol twice a day",
+    "none",
+    "no",
+    "no",
+]
+
+def configure_environment(db_path: str):
+    """Must run before importing the app: points every dependency at a local stand-in."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("GOOGLE_API_KEY", "bench")
+    os.environ.setdefault("LLM_PROVIDER", "offline")
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbench")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "bench")
+    os.environ.setdefault("TWILIO_PHONE_NUMBER", "+10000000000")
+    os.environ.setdefault("TWILIO_API_URL", "http://fake-twilio")
+    os.environ.setdefault("SENDGRID_API_KEY", "bench")
+    os.environ.setdefault("SENDGRID_API_URL", "http://fake-sendgrid")
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("LLM_BURST", "1000")
+    os.environ.setdefault("EMAIL_POLL_INTERVAL", "1")
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class LoopLagMonitor:
+    """Samples event-loop scheduling delay: how late a short sleep wakes up."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+async def run_sender(client, sender: str, latencies: list, think_time: float):
+    messages = ["Hi"] + ANSWERS
+    for i, body in enumerate(messages):
+        form = {"Body": body, "From": f"whatsapp:{sender}", "MessageSid": f"SM{sender[1:]}{i:04d}"}
+        started = time.perf_counter()
+        response = await client.post("/webhook", data=form)
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+        if think_time:
+            await asyncio.sleep(random.uniform(0, think_time))
+
+async def run_benchmark(args) -> dict:
+    import httpx
+    from fakes import FakeLLM, FakeSendGrid, FakeTwilio
+    import main
+
+    fake_llm = FakeLLM(latency=args.llm_latency, jitter=args.llm_latency / 3)
+    fake_sendgrid = FakeSendGrid()
+    fake_twilio = FakeTwilio()
+    main.llm_scheduler.llm = fake_llm
+    main.whatsapp_gateway.transport = fake_twilio.transport()
+    main.sendgrid_client.client = httpx.AsyncClient(
+        base_url="http://fake-sendgrid", transport=fake_sendgrid.transport()
+    )
+
+    latencies = []
+    monitor = LoopLagMonitor()
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            monitor.start()
+            started = time.perf_counter()
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(n):
+                async with semaphore:
+                    await run_sender(client, f"+1555{n:07d}", latencies, args.think_time)
+
+            await asyncio.gather(*(one(n) for n in range(args.senders)))
+            # Wait for the background pipeline to deliver every patient summary and clinician email
+            # Long summaries arrive in several parts; count patients, not messages
+            while (len(fake_twilio.recipients()) < args.senders or fake_sendgrid.sent < args.senders) \
+                    and time.perf_counter() - started < args.timeout:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            await monitor.stop()
+
+    completed = len(fake_twilio.recipients())
+    return {
+        "senders": args.senders,
+        "concurrency": args.concurrency,
+        "llm_latency": args.llm_latency,
+        "messages": len(latencies),
+        "completed_consultations": completed,
+        "elapsed_seconds": round(elapsed, 3),
+        "consultations_per_second": round(completed / elapsed, 3) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "latency_mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "loop_lag_p99_ms": round(percentile(monitor.samples, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(monitor.samples, default=0.0) * 1000, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "llm_calls": fake_llm.calls,
+        "llm_calls_per_consultation": round(fake_llm.calls / completed, 2) if completed else 0.0,
+        "emails_sent": fake_sendgrid.sent,
+    }
+
+# Metric -> True when higher is better
+COMPARED_METRICS = {
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "latency_p99_ms": False,
+    "consultations_per_second": True,
+    "loop_lag_p99_ms": False,
+    "peak_rss_mb": False,
+    "llm_calls_per_consultation": False,
+}
+
+def compare(result: dict, baseline: dict, max_regression: float) -> bool:
+    """Print the change against the baseline; returns False if any metric regressed past the limit."""
+    ok = True
+    print(f"\n{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if old is None or new is None:
+            continue
+        change = ((new - old) / old * 100) if old else 0.0
+        regression = -change if higher_is_better else change
+        flag = ""
+        if max_regression is not None and regression > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{metric:<28}{old:>12}{new:>12}{change:>+9.1f}%{flag}")
+    return ok
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--senders", type=int, default=100, help="simulated patients, one consultation each")
+    parser.add_argument("--concurrency", type=int, default=100, help="patients in conversation at once")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="mean fake Gemini latency in seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max random pause between a patient's messages")
+    parser.add_argument("--timeout", type=float, default=300.0, help="give up waiting for the pipeline after this long")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float, default=None, help="fail if a metric regresses by more than this %%")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(os.path.join(tmp, "bench.db"))
+        result = asyncio.run(run_benchmark(args))
+
+    print(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    cli()
@@ -9,6 +9,7 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+TWILIO_API_URL = os.getenv("TWILIO_API_URL", "https://api.twilio.com")
 NGROK_TOKEN = os.getenv("NGROK_TOKEN")
 SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
 MYSQL_CONFIG = {
@@ -17,4 +18,114 @@ MYSQL_CONFIG = {
     'password': os.getenv('MYSQLPASSWORD'),
     'port': os.getenv('MYSQLPORT'),
     'database': os.getenv('MYSQLDATABASE')
-}
\ No newline at end of file
+}
+# End-of-consultation pipeline
+COMPLETION_WORKERS = int(os.getenv("COMPLETION_WORKERS", "4"))
+COMPLETION_QUEUE_SIZE = int(os.getenv("COMPLETION_QUEUE_SIZE", "100"))
+COMPLETION_MAX_ATTEMPTS = int(os.getenv("COMPLETION_MAX_ATTEMPTS", "3"))
+
+# Chat session storage: "memory" (single worker) or "sqlite" (shared across workers)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+
+# LLM relevance verdict cache; set VERDICT_CACHE_PATH to keep it across restarts
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "50000"))
+VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", str(7 * 86400)))
+VERDICT_CACHE_PATH = os.getenv("VERDICT_CACHE_PATH")
+
+# "single": one structured LLM call for both summaries; "dual": separate patient and doctor calls
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "single")
+
+# Gemini scheduler: quota pacing, concurrency cap, retries and circuit breaker
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "500"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "20"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_VALIDATION_DEADLINE = float(os.getenv("LLM_VALIDATION_DEADLINE", "8"))
+LLM_SUMMARY_DEADLINE = float(os.getenv("LLM_SUMMARY_DEADLINE", "60"))
+
+# Clinician email outbox
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "30"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+
+# Readiness probe
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "2"))
+
+# Startup: create_all on boot, and optionally build clients / open DB connections before serving
+DB_CREATE_TABLES = os.getenv("DB_CREATE_TABLES", "1") == "1"
+PREWARM_CLIENTS = os.getenv("PREWARM_CLIENTS", "0") == "1"
+PREWARM_DB_CONNECTIONS = int(os.getenv("PREWARM_DB_CONNECTIONS", "2"))
+
+# Webhook retry deduplication by Twilio MessageSid
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "20000"))
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", "3600"))
+
+# Estimated input token budgets per LLM call; longer free-text answers are truncated
+PROMPT_BUDGET_VALIDATION = int(os.getenv("PROMPT_BUDGET_VALIDATION", "250"))
+PROMPT_BUDGET_SUMMARY = int(os.getenv("PROMPT_BUDGET_SUMMARY", "700"))
+
+# Write-behind batching of finished consultations (0 = write each one immediately)
+DB_WRITE_BATCH_WINDOW = float(os.getenv("DB_WRITE_BATCH_WINDOW", "0"))
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "50"))
+
+# Clinician/ops read API (history, export); the endpoints are disabled while ADMIN_API_KEY is unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+# Search ranks only the newest SEARCH_RANK_WINDOW matches, which bounds the cost of common words (0 = rank all)
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "10000"))
+
+# Returning patients: confirm stored profile fields in one turn instead of re-asking them
+PROFILE_PREFILL = os.getenv("PROFILE_PREFILL", "1") == "1"
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "3600"))
+
+# Abandoned sessions: removed after SESSION_IDLE_TTL seconds without a message, optionally with a notice
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "60"))
+SESSION_EXPIRY_NOTICE = os.getenv("SESSION_EXPIRY_NOTICE", "0") == "1"
+
+# Model routing: cheap deterministic settings for relevance checks, quality-tuned settings for summaries.
+# LLM_PROVIDER=offline swaps Gemini for a deterministic local model (no network, no API key).
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_VALIDATION_MODEL = os.getenv("LLM_VALIDATION_MODEL", "gemini-1.5-flash-8b")
+LLM_VALIDATION_MAX_TOKENS = int(os.getenv("LLM_VALIDATION_MAX_TOKENS", "8"))
+LLM_SUMMARY_MODEL = os.getenv("LLM_SUMMARY_MODEL", "gemini-1.5-flash")
+LLM_SUMMARY_TEMPERATURE = float(os.getenv("LLM_SUMMARY_TEMPERATURE", "0.4"))
+LLM_SUMMARY_MAX_TOKENS = int(os.getenv("LLM_SUMMARY_MAX_TOKENS", "1024"))
+
+# Micro-batching of LLM relevance checks across senders (0 = send each check on its own)
+VALIDATION_BATCH_WINDOW = float(os.getenv("VALIDATION_BATCH_WINDOW", "0"))
+VALIDATION_BATCH_MAX = int(os.getenv("VALIDATION_BATCH_MAX", "16"))
+
+# Production launcher (service.py --production): worker processes behind a sender-affinity dispatcher
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "5001"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", str(os.cpu_count() or 1)))
+WORKER_MAX_IN_FLIGHT = int(os.getenv("WORKER_MAX_IN_FLIGHT", "64"))
+WORKER_LIMIT_CONCURRENCY = int(os.getenv("WORKER_LIMIT_CONCURRENCY", "128"))
+WORKER_SOCKET_DIR = os.getenv("WORKER_SOCKET_DIR", "")
+
+# Consultation questionnaire (steps, validators, column mapping, branching); edits are picked up without a restart
+QUESTIONNAIRE_PATH = os.getenv("QUESTIONNAIRE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "questionnaire.json"))
+QUESTIONNAIRE_RELOAD_INTERVAL = float(os.getenv("QUESTIONNAIRE_RELOAD_INTERVAL", "5"))
+
+# Daily analytics rollups: longest date range one dashboard request may ask for
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "366"))
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "5000"))
+
+# Outbound WhatsApp messages: sender throughput (messages/second), per-recipient pacing and retries on 429/5xx
+WHATSAPP_MESSAGES_PER_SECOND = float(os.getenv("WHATSAPP_MESSAGES_PER_SECOND", "80"))
+WHATSAPP_BURST = int(os.getenv("WHATSAPP_BURST", "80"))
+WHATSAPP_RECIPIENT_PER_MINUTE = float(os.getenv("WHATSAPP_RECIPIENT_PER_MINUTE", "10"))
+WHATSAPP_RECIPIENT_BURST = int(os.getenv("WHATSAPP_RECIPIENT_BURST", "5"))
+WHATSAPP_MAX_ATTEMPTS = int(os.getenv("WHATSAPP_MAX_ATTEMPTS", "4"))
@@ -1,25 +1,80 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import (
+    create_engine, inspect, text, func, insert, select, delete, or_, and_, Column, Integer, String, Text, Date,
+    DateTime, ForeignKey, Index
+)
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Iterator, List, Optional, Tuple
+import asyncio
 import os
+import threading
 from urllib.parse import urlparse
 
-# Parse the MySQL URL from environment
-mysql_url = os.getenv('MYSQL_PUBLIC_URL')
-parsed = urlparse(mysql_url)
+from analytics import rollup_keys
+from search_index import search_index_for, SEARCH_COLUMNS
+from startup import startup_report
 
-# Construct Database URL for SQLAlchemy
-DATABASE_URL = f"mysql+mysqlconnector://{parsed.username}:{parsed.password}@{parsed.hostname}:{parsed.port or 3306}/{parsed.path.lstrip('/')}"
+# Connection pool sizing. Every DB call runs on a dedicated thread pool that is
+# sized to the connection pool, so a worker thread never waits on a connection.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
 
-# Create SQLAlchemy engine and session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_database_url():
+    # DATABASE_URL takes precedence so tests can run against SQLite,
+    # e.g. DATABASE_URL=sqlite:///./local.db
+    database_url = os.getenv('DATABASE_URL')
+    if database_url:
+        return database_url
+
+    # Parse the MySQL URL from environment
+    parsed = urlparse(os.getenv('MYSQL_PUBLIC_URL'))
+
+    # Construct Database URL for SQLAlchemy
+    return f"mysql+mysqlconnector://{parsed.username}:{parsed.password}@{parsed.hostname}:{parsed.port or 3306}/{parsed.path.lstrip('/')}"
+
+def build_engine(database_url: str):
+    if database_url.startswith('sqlite'):
+        # SQLite connections are handed between executor threads
+        return create_engine(database_url, connect_args={"check_same_thread": False})
+
+    return create_engine(
+        database_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
+# The engine is built on first use, so importing this module never touches the network
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                with startup_report.measure("client", "database_engine"):
+                    _engine = build_engine(get_database_url())
+    return _engine
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class Patient(Base):
     __tablename__ = "patients"
-    
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False)
     mobile_number = Column(String(20), unique=True, index=True, nullable=False)
@@ -28,12 +83,12 @@ class Patient(Base):
     allergies = Column(Text)
     email = Column(String(255))  # Added email field
     created_at = Column(DateTime, default=datetime.utcnow)
-    
+
     consultations = relationship("Consultation", back_populates="patient")
 
 class Consultation(Base):
     __tablename__ = "consultations"
-    
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     consultation_date = Column(DateTime, default=datetime.utcnow)
@@ -41,75 +96,494 @@ class Consultation(Base):
     symptoms_duration = Column(String(100))
     patient_summary = Column(Text)
     doctor_summary = Column(Text)
-    
+    urgency = Column(String(16))  # immediate/soon/routine/unknown, as the summary reported it
+    # The profile as it was at this consultation, for rollups; patients.* holds the latest answers
+    patient_age = Column(Integer)
+    patient_blood_group = Column(String(10))
+
     patient = relationship("Patient", back_populates="consultations")
 
+    # Serves keyset pagination of a patient's history, newest first
+    __table_args__ = (Index("ix_consultations_patient_date", "patient_id", "consultation_date"),)
+
+class EmailOutbox(Base):
+    """Durable queue of clinician emails, drained by EmailOutboxDrainer in mail.py."""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    consultation_id = Column(Integer, ForeignKey("consultations.id"))
+    to_emails = Column(Text, nullable=False)  # comma-separated
+    subject = Column(String(255), nullable=False)
+    html_content = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending/sending/sent/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+class ConsultationRollup(Base):
+    """
+    Daily consultation counters for dashboards, one row per (day, dimension, value),
+    e.g. (2024-05-01, "symptom_category", "respiratory"). Incremented in the same
+    transaction as each consultation; backfill_rollups.py rebuilds past days.
+    """
+    __tablename__ = "consultation_rollups"
+
+    day = Column(Date, primary_key=True)
+    dimension = Column(String(32), primary_key=True)
+    value = Column(String(64), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+@dataclass
+class OutboxEmail:
+    """A clinician email, queued in the outbox by the transaction that saves its consultation."""
+    to_emails: List[str]
+    subject: str
+    html_content: str
+
+@dataclass
+class ConsultationRecord:
+    """Everything written when a consultation finishes: the patient profile and the consultation."""
+    mobile_number: str
+    name: str
+    age: Optional[int]
+    symptoms: str
+    symptoms_duration: str
+    patient_summary: str
+    doctor_summary: str
+    blood_group: Optional[str] = None
+    allergies: Optional[str] = None
+    email: Optional[str] = None
+    # As reported alongside the summaries; see summaries.URGENCY_LEVELS
+    urgency: Optional[str] = None
+    outbox_email: Optional[OutboxEmail] = None
+
+@dataclass
+class SavedConsultation:
+    patient_id: int
+    consultation_id: int
+
+# Columns included in consultation exports, in output order
+EXPORT_COLUMNS = (
+    Consultation.id.label("consultation_id"),
+    Consultation.consultation_date,
+    Patient.id.label("patient_id"),
+    Patient.mobile_number,
+    Patient.name,
+    Patient.age,
+    Patient.blood_group,
+    Consultation.symptoms,
+    Consultation.symptoms_duration,
+    Consultation.patient_summary,
+    Consultation.doctor_summary,
+)
+
 class DatabaseManager:
-    def __init__(self):
-        self.SessionLocal = SessionLocal
+    def __init__(self, session_factory=SessionLocal, max_workers: int = DB_POOL_SIZE + DB_MAX_OVERFLOW):
+        self.SessionLocal = session_factory
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
 
+    @contextmanager
     def get_db(self):
-        db = self.SessionLocal()
+        """Yield a session scoped to one unit of work; rolls back on error and always closes."""
+        db = self.SessionLocal(bind=get_engine())
         try:
-            return db
+            yield db
+        except Exception:
+            db.rollback()
+            raise
         finally:
             db.close()
 
-    async def create_or_update_patient(self, db, mobile_number: str, name: str, age: int, 
-                                     blood_group: str = None, allergies: str = None,
-                                     email: str = None) -> Patient:  # Added email parameter
-        try:
-            mobile_number = mobile_number.replace('whatsapp:', '')
-            patient = db.query(Patient).filter(Patient.mobile_number == mobile_number).first()
-            
-            if patient:
-                patient.name = name
-                patient.age = age
-                patient.blood_group = blood_group
-                patient.allergies = allergies
-                patient.email = email  # Update email
-            else:
-                patient = Patient(
-                    mobile_number=mobile_number,
-                    name=name,
-                    age=age,
-                    blood_group=blood_group,
-                    allergies=allergies,
-                    email=email  # Add email to new patient
-                )
-                db.add(patient)
-            
-            db.commit()
-            db.refresh(patient)
-            return patient
-            
-        except Exception as e:
-            db.rollback()
-            raise
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking `fn(db, ...)` on the DB thread pool with its own session."""
+        def _call():
+            with self.get_db() as db:
+                return fn(db, *args, **kwargs)
 
-    async def create_consultation(self, db, patient_id: int, symptoms: str, 
-                                symptoms_duration: str, patient_summary: str, 
-                                doctor_summary: str) -> Consultation:
-        try:
-            consultation = Consultation(
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _call)
+
+    async def ping(self):
+        """Round trip to the database through the pool; used by the readiness probe."""
+        await self.run(lambda db: db.execute(text("SELECT 1")))
+
+    def _upsert_patient(self, db, record: ConsultationRecord) -> int:
+        """
+        Insert or update the patient row without a separate read. On MySQL this is one
+        INSERT ... ON DUPLICATE KEY UPDATE on mobile_number; LAST_INSERT_ID(id) makes the
+        existing row's id come back as lastrowid. Other dialects (SQLite in tests) use a
+        portable lookup followed by UPDATE or INSERT in the same transaction.
+        """
+        values = {
+            "mobile_number": record.mobile_number.replace('whatsapp:', ''),
+            "name": record.name,
+            "age": record.age,
+            "blood_group": record.blood_group,
+            "allergies": record.allergies,
+            "email": record.email,
+        }
+        if db.get_bind().dialect.name == "mysql":
+            stmt = mysql_insert(Patient).values(**values)
+            stmt = stmt.on_duplicate_key_update(
+                id=func.LAST_INSERT_ID(Patient.id),
+                **{key: stmt.inserted[key] for key in values if key != "mobile_number"}
+            )
+            patient_id = db.execute(stmt).lastrowid
+            if patient_id:
+                return patient_id
+            return db.query(Patient.id).filter(Patient.mobile_number == values["mobile_number"]).scalar()
+
+        patient_id = db.query(Patient.id).filter(Patient.mobile_number == values["mobile_number"]).scalar()
+        if patient_id is not None:
+            db.query(Patient).filter(Patient.id == patient_id).update(values, synchronize_session=False)
+            return patient_id
+        return db.execute(insert(Patient).values(**values)).inserted_primary_key[0]
+
+    def _save_consultations(self, db, records: List[ConsultationRecord]) -> List[SavedConsultation]:
+        """Upsert each patient and insert its consultation and outbox email, all committed in one transaction."""
+        saved = []
+        searchable = []
+        rollups = Counter()
+        for record in records:
+            patient_id = self._upsert_patient(db, record)
+            # Set here rather than by the column default so the rollup day matches the stored date
+            consultation_date = datetime.utcnow()
+            consultation_id = db.execute(insert(Consultation).values(
                 patient_id=patient_id,
-                symptoms=symptoms,
-                symptoms_duration=symptoms_duration,
-                patient_summary=patient_summary,
-                doctor_summary=doctor_summary
+                consultation_date=consultation_date,
+                symptoms=record.symptoms,
+                symptoms_duration=record.symptoms_duration,
+                patient_summary=record.patient_summary,
+                doctor_summary=record.doctor_summary,
+                urgency=record.urgency,
+                patient_age=record.age,
+                patient_blood_group=record.blood_group
+            )).inserted_primary_key[0]
+            if record.outbox_email is not None:
+                db.add(EmailOutbox(
+                    consultation_id=consultation_id,
+                    to_emails=",".join(record.outbox_email.to_emails),
+                    subject=record.outbox_email.subject,
+                    html_content=record.outbox_email.html_content
+                ))
+            saved.append(SavedConsultation(patient_id=patient_id, consultation_id=consultation_id))
+            searchable.append({"id": consultation_id, **{c: getattr(record, c) for c in SEARCH_COLUMNS}})
+            rollups.update(rollup_keys(consultation_date, record.symptoms, record.age, record.blood_group,
+                                       record.urgency))
+        self._index_for_search(db, searchable)
+        self._add_rollups(db, rollups)
+        db.commit()
+        return saved
+
+    async def save_consultation(self, record: ConsultationRecord) -> SavedConsultation:
+        return (await self.save_consultations([record]))[0]
+
+    async def save_consultations(self, records: List[ConsultationRecord]) -> List[SavedConsultation]:
+        return await self.run(partial(self._save_consultations, records=records))
+
+    def _add_rollups(self, db, counts: Counter):
+        """Add to the daily counters in the caller's transaction: one upsert per distinct counter."""
+        if not counts:
+            return
+        rows = [{"day": day, "dimension": dimension, "value": value, "count": n}
+                for (day, dimension, value), n in counts.items()]
+        dialect = db.get_bind().dialect.name
+        if dialect == "mysql":
+            stmt = mysql_insert(ConsultationRollup)
+            stmt = stmt.on_duplicate_key_update(count=ConsultationRollup.count + stmt.inserted["count"])
+        elif dialect == "sqlite":
+            stmt = sqlite_insert(ConsultationRollup)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["day", "dimension", "value"],
+                set_={"count": ConsultationRollup.count + stmt.excluded["count"]}
+            )
+        else:
+            for row in rows:
+                updated = db.query(ConsultationRollup).filter_by(
+                    day=row["day"], dimension=row["dimension"], value=row["value"]
+                ).update({"count": ConsultationRollup.count + row["count"]}, synchronize_session=False)
+                if not updated:
+                    db.add(ConsultationRollup(**row))
+            return
+        db.execute(stmt, rows)
+
+    def iter_rollup_sources(self, until: date, chunk_size: int = 5000) -> Iterator[list]:
+        """
+        Stream (id, consultation_date, symptoms, age, blood_group, urgency) for every
+        consultation before `until`, one keyset query per chunk. Age, blood group and
+        urgency are the values stored with the consultation, the same ones its live
+        rollup update used. Blocking: iterate from a worker thread.
+        """
+        query = (
+            select(Consultation.id, Consultation.consultation_date, Consultation.symptoms,
+                   Consultation.patient_age, Consultation.patient_blood_group, Consultation.urgency)
+            .where(Consultation.consultation_date < datetime.combine(until, datetime.min.time()))
+        )
+        return self._iter_by_id(query, chunk_size)
+
+    def _replace_rollups(self, db, counts: Counter, until: date) -> int:
+        """Swap in rebuilt counters for every day before `until` in one transaction; later days are untouched."""
+        db.execute(delete(ConsultationRollup).where(ConsultationRollup.day < until))
+        rows = [{"day": day, "dimension": dimension, "value": value, "count": n}
+                for (day, dimension, value), n in counts.items() if day < until]
+        for start in range(0, len(rows), 1000):
+            db.execute(insert(ConsultationRollup), rows[start:start + 1000])
+        db.commit()
+        return len(rows)
+
+    async def replace_rollups(self, counts: Counter, until: date) -> int:
+        return await self.run(partial(self._replace_rollups, counts=counts, until=until))
+
+    def _daily_rollups(self, db, start: date, end: date, dimensions: Tuple[str, ...]) -> List[ConsultationRollup]:
+        """Counters for days in [start, end]; reads at most days x values rows, however long the history."""
+        return (
+            db.query(ConsultationRollup)
+            .filter(ConsultationRollup.day >= start, ConsultationRollup.day <= end,
+                    ConsultationRollup.dimension.in_(dimensions))
+            .order_by(ConsultationRollup.day, ConsultationRollup.dimension, ConsultationRollup.value)
+            .all()
+        )
+
+    async def daily_rollups(self, start: date, end: date, dimensions: Tuple[str, ...]) -> List[ConsultationRollup]:
+        return await self.run(partial(self._daily_rollups, start=start, end=end, dimensions=dimensions))
+
+    def _index_for_search(self, db, rows: List[dict]):
+        """Add new consultations to the full-text index in the same transaction as the rows themselves."""
+        index = search_index_for(db.get_bind().dialect.name)
+        if index is not None:
+            index.index(db, rows)
+
+    def search_supported(self) -> bool:
+        return search_index_for(get_engine().dialect.name) is not None
+
+    def _search_consultations(self, db, terms: List[str], limit: int, after: Optional[Tuple[float, int]] = None,
+                              patient_id: Optional[int] = None, rank_window: int = 0) -> list:
+        """
+        Consultations matching every term, best match first. `after` is the
+        (score, consultation_id) of the last hit on the previous page. With
+        `rank_window` set, only that many of the newest matches are ranked.
+        """
+        return search_index_for(db.get_bind().dialect.name).search(db, terms, limit, after, patient_id, rank_window)
+
+    async def search_consultations(self, terms: List[str], limit: int, after: Optional[Tuple[float, int]] = None,
+                                   patient_id: Optional[int] = None, rank_window: int = 0) -> list:
+        return await self.run(partial(self._search_consultations, terms=terms, limit=limit, after=after,
+                                      patient_id=patient_id, rank_window=rank_window))
+
+    def _get_patient(self, db, mobile_number: str) -> Optional[Patient]:
+        return db.query(Patient).filter(Patient.mobile_number == mobile_number.replace('whatsapp:', '')).first()
+
+    def _list_consultations(self, db, patient_id: int, limit: int,
+                            before: Optional[Tuple[datetime, int]] = None) -> List[Consultation]:
+        """
+        One page of a patient's consultations, newest first. `before` is the
+        (consultation_date, id) of the last row of the previous page, so each page is
+        a range scan on ix_consultations_patient_date rather than an OFFSET.
+        """
+        query = db.query(Consultation).filter(Consultation.patient_id == patient_id)
+        if before is not None:
+            before_date, before_id = before
+            query = query.filter(or_(
+                Consultation.consultation_date < before_date,
+                and_(Consultation.consultation_date == before_date, Consultation.id < before_id)
+            ))
+        return query.order_by(Consultation.consultation_date.desc(), Consultation.id.desc()).limit(limit).all()
+
+    async def get_patient(self, mobile_number: str) -> Optional[Patient]:
+        return await self.run(partial(self._get_patient, mobile_number=mobile_number))
+
+    async def list_consultations(self, patient_id: int, limit: int,
+                                 before: Optional[Tuple[datetime, int]] = None) -> List[Consultation]:
+        return await self.run(partial(self._list_consultations, patient_id=patient_id, limit=limit, before=before))
+
+    def _iter_by_id(self, query, chunk_size: int) -> Iterator[list]:
+        """
+        Run `query`, whose first column is Consultation.id, as a series of keyset pages:
+        WHERE id > :last_id ORDER BY id LIMIT :chunk_size. Each page is one short query
+        on its own session, so memory and connection use stay flat whether or not the
+        driver can stream (mysql-connector buffers whole result sets).
+        """
+        last_id = 0
+        while True:
+            with self.get_db() as db:
+                rows = db.execute(
+                    query.where(Consultation.id > last_id).order_by(Consultation.id).limit(chunk_size)
+                ).all()
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
+
+    def iter_consultation_rows(self, since: Optional[datetime] = None, patient_id: Optional[int] = None,
+                               chunk_size: int = 1000) -> Iterator[list]:
+        """
+        Stream consultations joined with their patient as lists of at most `chunk_size`
+        plain rows, in id order, one keyset query per list. Blocking: iterate from a
+        worker thread.
+        """
+        query = select(*EXPORT_COLUMNS).join(Patient, Consultation.patient_id == Patient.id)
+        if since is not None:
+            query = query.where(Consultation.consultation_date >= since)
+        if patient_id is not None:
+            query = query.where(Consultation.patient_id == patient_id)
+        return self._iter_by_id(query, chunk_size)
+
+    def _claim_due_emails(self, db, limit: int, lease_seconds: int) -> list:
+        """
+        Claim up to `limit` due emails. A claim is a lease: rows left in 'sending'
+        by a crashed worker become due again once the lease expires.
+        """
+        now = datetime.utcnow()
+        candidates = (
+            db.query(EmailOutbox)
+            .filter(EmailOutbox.status.in_(("pending", "sending")), EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(limit)
+            .all()
+        )
+        claimed = []
+        for email in candidates:
+            updated = (
+                db.query(EmailOutbox)
+                .filter(EmailOutbox.id == email.id, EmailOutbox.status.in_(("pending", "sending")),
+                        EmailOutbox.next_attempt_at <= now)
+                .update({"status": "sending", "next_attempt_at": now + timedelta(seconds=lease_seconds)},
+                        synchronize_session=False)
             )
-            
-            db.add(consultation)
-            db.commit()
-            db.refresh(consultation)
-            return consultation
-            
+            if updated:
+                claimed.append(email)
+        db.commit()
+        return claimed
+
+    def _mark_email_sent(self, db, email_id: int):
+        db.query(EmailOutbox).filter(EmailOutbox.id == email_id).update(
+            {"status": "sent", "sent_at": datetime.utcnow(), "attempts": EmailOutbox.attempts + 1, "last_error": None},
+            synchronize_session=False
+        )
+        db.commit()
+
+    def _mark_email_failed(self, db, email_id: int, error: str, retry_at: datetime = None):
+        """Reschedule for `retry_at`, or park as 'failed' when no retry is left."""
+        db.query(EmailOutbox).filter(EmailOutbox.id == email_id).update(
+            {
+                "status": "pending" if retry_at else "failed",
+                "next_attempt_at": retry_at or datetime.utcnow(),
+                "attempts": EmailOutbox.attempts + 1,
+                "last_error": error[:2000],
+            },
+            synchronize_session=False
+        )
+        db.commit()
+
+    async def claim_due_emails(self, limit: int, lease_seconds: int = 120) -> list:
+        return await self.run(partial(self._claim_due_emails, limit=limit, lease_seconds=lease_seconds))
+
+    async def mark_email_sent(self, email_id: int):
+        await self.run(partial(self._mark_email_sent, email_id=email_id))
+
+    async def mark_email_failed(self, email_id: int, error: str, retry_at: datetime = None):
+        await self.run(partial(self._mark_email_failed, email_id=email_id, error=error, retry_at=retry_at))
+
+class ConsultationWriter:
+    """
+    Optional write-behind batcher for finished consultations. Saves submitted within
+    `batch_window` seconds of each other (up to `max_batch`) share one transaction,
+    so consultations that complete together cost one commit. Callers still wait for
+    the commit, so nothing is acknowledged before it is durable. If a batch fails,
+    its records are retried one by one so a single bad row fails only its own save.
+    With `batch_window` 0 every save is written immediately.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, batch_window: float = 0.0, max_batch: int = 50):
+        self.db_manager = db_manager
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._pending = []  # (record, future)
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    async def save(self, record: ConsultationRecord) -> SavedConsultation:
+        if self.batch_window <= 0:
+            saved = await self.db_manager.save_consultation(record)
+            self._record_batch(1)
+            return saved
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((record, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._write(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, batch):
+        try:
+            results = list(zip(batch, await self.db_manager.save_consultations([record for record, _ in batch])))
+            self._record_batch(len(batch))
         except Exception as e:
-            db.rollback()
-            raise
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            print(f"Consultation batch of {len(batch)} failed, retrying individually: {str(e)}")
+            for item in batch:
+                await self._write([item])
+            return
+        for (_, future), saved in results:
+            if not future.done():
+                future.set_result(saved)
+
+    def _record_batch(self, size: int):
+        self.batches += 1
+        self.rows += size
+        self.largest_batch = max(self.largest_batch, size)
+
+    async def close(self):
+        """Write anything still pending and wait for in-flight batches."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "rows": self.rows, "largest_batch": self.largest_batch}
+
+def add_missing_columns(engine, table):
+    """create_all skips tables that already exist; add nullable columns introduced since then."""
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
 
 def init_db():
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine, Consultation.__table__)
+    # create_all skips tables that already exist; add indexes introduced since then
+    for index in Consultation.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    search_index = search_index_for(engine.dialect.name)
+    if search_index is not None:
+        search_index.create(engine)
 
 # Initialize database manager
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = DatabaseManager()
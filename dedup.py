@@ -0,0 +1,71 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+class MessageDedupCache:
+    """
+    Remembers the TwiML reply for each Twilio MessageSid (LRU with TTL) so webhook
+    retries replay the original reply instead of re-running validation and advancing
+    the conversation again. A retry that arrives while the first delivery is still
+    being handled waits for that result.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # sid -> (future, stored_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, sid: str) -> Optional[asyncio.Future]:
+        entry = self._entries.get(sid)
+        if entry is None:
+            return None
+        future, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[sid]
+            return None
+        self._entries.move_to_end(sid)
+        return future
+
+    async def run(self, sid: Optional[str], handler: Callable[[], Awaitable[str]]) -> str:
+        if not sid:
+            return await handler()
+
+        future = self._lookup(sid)
+        if future is not None:
+            self.hits += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._entries[sid] = (future, time.monotonic())
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+        try:
+            result = await handler()
+        except BaseException as e:
+            # Let Twilio's retry run the message again rather than replaying a failure
+            self._entries.pop(sid, None)
+            future.set_exception(e)
+            future.exception()  # mark retrieved when no duplicate is waiting
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,130 @@
+"""
+Front dispatcher for multi-worker deployments. Each worker process keeps its own
+in-memory sessions, so every webhook from a given sender must reach the same
+worker: the Twilio `From` number is hashed to pick one. Other requests are spread
+round-robin. Per-worker in-flight limits shed load instead of queueing without bound.
+"""
+import asyncio
+import itertools
+import zlib
+from typing import List
+from urllib.parse import parse_qs
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from twilio.twiml.messaging_response import MessagingResponse
+
+from metrics import registry
+
+# Connection-level headers that must not be forwarded
+HOP_BY_HOP = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade",
+              "proxy-authorization", "proxy-authenticate", "host", "content-length"}
+
+def worker_for(sender: str, workers: int) -> int:
+    """Stable sender -> worker mapping (crc32, unlike hash(), is the same in every process)."""
+    return zlib.crc32(sender.encode()) % workers
+
+def busy_reply() -> str:
+    response = MessagingResponse()
+    response.message("We're handling a lot of messages right now. Please send your last message again in a minute.")
+    return str(response)
+
+class Dispatcher:
+    def __init__(self, sockets: List[str], max_in_flight: int = 64, timeout: float = 30.0):
+        self.sockets = sockets
+        self.max_in_flight = max_in_flight
+        self.clients = [
+            httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path), base_url="http://worker", timeout=timeout)
+            for path in sockets
+        ]
+        self.in_flight = [0] * len(sockets)
+        self.forwarded = [0] * len(sockets)
+        self.shed = 0
+        self.errors = 0
+        self._round_robin = itertools.count()
+
+    def pick(self, path: str, body: bytes) -> int:
+        if path == "/webhook":
+            sender = parse_qs(body.decode("utf-8", "replace")).get("From", [""])[0]
+            return worker_for(sender, len(self.clients))
+        return next(self._round_robin) % len(self.clients)
+
+    async def handle(self, request: Request) -> Response:
+        body = await request.body()
+        path = request.url.path
+        index = self.pick(path, body)
+        if self.in_flight[index] >= self.max_in_flight:
+            self.shed += 1
+            if path == "/webhook":
+                # Answer Twilio normally so the patient is told to resend rather than hearing nothing
+                return Response(busy_reply(), media_type="application/xml")
+            return PlainTextResponse("Service overloaded", status_code=503, headers={"Retry-After": "5"})
+
+        client = self.clients[index]
+        self.in_flight[index] += 1
+        try:
+            upstream = await client.send(client.build_request(
+                request.method,
+                path + (f"?{request.url.query}" if request.url.query else ""),
+                headers=[(k, v) for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP],
+                content=body
+            ), stream=True)
+        except httpx.HTTPError as e:
+            self.in_flight[index] -= 1
+            self.errors += 1
+            print(f"Dispatch to worker {index} failed: {str(e)}")
+            return PlainTextResponse("Worker unavailable", status_code=502)
+
+        self.forwarded[index] += 1
+
+        async def relay():
+            # Released however the stream ends: Starlette skips background tasks when streaming
+            # raises, and a worker dying mid-response would otherwise keep its slot forever
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            finally:
+                await upstream.aclose()
+                self.in_flight[index] -= 1
+
+        # Stream the body through so large exports are never buffered here
+        return StreamingResponse(
+            relay(),
+            status_code=upstream.status_code,
+            headers={k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP}
+        )
+
+    async def health(self, request: Request) -> Response:
+        """Ready only when every worker's own readiness probe passes."""
+        async def check(client):
+            try:
+                return (await client.get("/health")).status_code == 200
+            except httpx.HTTPError:
+                return False
+
+        results = await asyncio.gather(*(check(client) for client in self.clients))
+        workers = {f"worker_{i}": "ok" if ok else "unavailable" for i, ok in enumerate(results)}
+        return JSONResponse({"status": "healthy" if all(results) else "unavailable", "workers": workers},
+                            status_code=200 if all(results) else 503)
+
+    async def metrics(self, request: Request) -> Response:
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    async def close(self):
+        await asyncio.gather(*(client.aclose() for client in self.clients))
+
+    def build_app(self, lifespan=None) -> Starlette:
+        registry.gauge("healthbot_dispatch_in_flight", "Requests in flight per worker.",
+                       lambda: [({"worker": str(i)}, n) for i, n in enumerate(self.in_flight)])
+        registry.gauge("healthbot_dispatch_forwarded", "Requests forwarded per worker.",
+                       lambda: [({"worker": str(i)}, n) for i, n in enumerate(self.forwarded)])
+        registry.gauge("healthbot_dispatch_rejected", "Requests shed at the in-flight limit or failed to reach a worker.",
+                       lambda: [({"reason": "shed"}, self.shed), ({"reason": "worker_error"}, self.errors)])
+        return Starlette(routes=[
+            Route("/dispatcher/health", self.health),
+            Route("/dispatcher/metrics", self.metrics),
+            Route("/{path:path}", self.handle, methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]),
+        ], lifespan=lifespan)
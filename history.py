@@ -0,0 +1,192 @@
+"""Read endpoints over stored consultations: paginated patient history, full-text search, daily analytics and bulk export."""
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from analytics import DIMENSIONS
+from auth import require_api_key
+from config import (
+    HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, EXPORT_CHUNK_SIZE, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE,
+    SEARCH_RANK_WINDOW, ANALYTICS_MAX_DAYS
+)
+from db import db_manager, EXPORT_COLUMNS
+from metrics import span
+from search_index import parse_terms
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+def encode_cursor(consultation_date: datetime, consultation_id: int) -> str:
+    raw = f"{consultation_date.isoformat()}|{consultation_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date, consultation_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(date), int(consultation_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_search_cursor(score: float, consultation_id: int) -> str:
+    raw = f"{score!r}|{consultation_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        score, consultation_id = raw.rsplit("|", 1)
+        return float(score), int(consultation_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+@router.get("/patients/{mobile_number}/consultations")
+async def patient_consultations(mobile_number: str, cursor: Optional[str] = None,
+                                limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE)):
+    """A patient's consultations, newest first. Pass `next_cursor` back as `cursor` for the next page."""
+    before = decode_cursor(cursor) if cursor else None
+    with span("history_page"):
+        patient = await db_manager.get_patient(mobile_number)
+        if patient is None:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        # One extra row tells us whether another page exists
+        rows = await db_manager.list_consultations(patient.id, limit + 1, before)
+
+    page = rows[:limit]
+    return {
+        "patient": {
+            "id": patient.id,
+            "name": patient.name,
+            "mobile_number": patient.mobile_number,
+            "age": patient.age,
+            "blood_group": patient.blood_group,
+            "allergies": patient.allergies,
+        },
+        "consultations": [
+            {
+                "id": c.id,
+                "consultation_date": _isoformat(c.consultation_date),
+                "symptoms": c.symptoms,
+                "symptoms_duration": c.symptoms_duration,
+                "patient_summary": c.patient_summary,
+                "doctor_summary": c.doctor_summary,
+            }
+            for c in page
+        ],
+        "next_cursor": encode_cursor(page[-1].consultation_date, page[-1].id) if len(rows) > limit else None,
+    }
+
+@router.get("/search")
+async def search_consultations(q: str = Query(..., min_length=1, max_length=200), cursor: Optional[str] = None,
+                               patient_id: Optional[int] = None,
+                               limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE)):
+    """
+    Consultations whose symptoms or summaries contain every word (or "quoted phrase")
+    of `q`, best match first. Pass `next_cursor` back as `cursor` for the next page.
+    Unless `patient_id` narrows the search, ranking covers the newest
+    SEARCH_RANK_WINDOW matches.
+    """
+    terms = parse_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Empty search query")
+    if not db_manager.search_supported():
+        raise HTTPException(status_code=501, detail="Search is not available on this database")
+    after = decode_search_cursor(cursor) if cursor else None
+    with span("search_page"):
+        rows = await db_manager.search_consultations(terms, limit + 1, after, patient_id, SEARCH_RANK_WINDOW)
+
+    page = rows[:limit]
+    return {
+        "query": terms,
+        "results": [
+            {
+                "id": row.consultation_id,
+                "consultation_date": _isoformat(row.consultation_date),
+                "patient": {"id": row.patient_id, "name": row.name, "mobile_number": row.mobile_number},
+                "symptoms": row.symptoms,
+                "symptoms_duration": row.symptoms_duration,
+                "patient_summary": row.patient_summary,
+                "doctor_summary": row.doctor_summary,
+                "score": row.score,
+            }
+            for row in page
+        ],
+        "next_cursor": encode_search_cursor(page[-1].score, page[-1].consultation_id) if len(rows) > limit else None,
+    }
+
+@router.get("/analytics/daily")
+async def daily_analytics(start: date, end: date, dimension: Optional[List[str]] = Query(None)):
+    """
+    Consultation counts per day from `start` to `end` inclusive: the total plus
+    breakdowns by symptom category, urgency, age band and blood group (or only the
+    requested `dimension`s). Served from the rollup table, so the cost depends on
+    the date range, not on how many consultations are stored. Days with no
+    consultations are returned with a zero total.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end is before start")
+    days = (end - start).days + 1
+    if days > ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {ANALYTICS_MAX_DAYS} days")
+    dimensions = tuple(dimension) if dimension else DIMENSIONS
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dimension: {', '.join(sorted(unknown))}")
+
+    with span("analytics_daily"):
+        rows = await db_manager.daily_rollups(start, end, dimensions + ("total",))
+
+    by_day = {start + timedelta(days=i): {"total": 0} for i in range(days)}
+    for row in rows:
+        counts = by_day[row.day]
+        if row.dimension == "total":
+            counts["total"] = row.count
+        elif row.dimension in dimensions:
+            counts.setdefault(row.dimension, {})[row.value] = row.count
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": [{"day": day.isoformat(), **counts} for day, counts in by_day.items()],
+    }
+
+def _ndjson_chunks(rows_iter):
+    for rows in rows_iter:
+        yield "".join(
+            json.dumps({key: _isoformat(value) for key, value in zip(EXPORT_FIELDS, row)}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+def _csv_chunks(rows_iter):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+    for rows in rows_iter:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_isoformat(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+
+@router.get("/consultations/export")
+def export_consultations(format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                         since: Optional[datetime] = None, patient_id: Optional[int] = None):
+    """
+    Stream every consultation (optionally since a date or for one patient) as NDJSON
+    or CSV. Rows are fetched in keyset pages of EXPORT_CHUNK_SIZE and written as they
+    arrive, so the first bytes go out immediately and memory stays constant.
+    """
+    rows_iter = db_manager.iter_consultation_rows(since=since, patient_id=patient_id, chunk_size=EXPORT_CHUNK_SIZE)
+    if format == "csv":
+        return StreamingResponse(_csv_chunks(rows_iter), media_type="text/csv",
+                                 headers={"Content-Disposition": "attachment; filename=consultations.csv"})
+    return StreamingResponse(_ndjson_chunks(rows_iter), media_type="application/x-ndjson")
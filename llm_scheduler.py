@@ -0,0 +1,244 @@
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from metrics import llm_call_seconds, record_llm_usage
+from model_router import ModelRoute, ModelRouter
+from ratelimit import TokenBucket
+
+# Lower value is served first
+PRIORITY_SUMMARY = 0
+PRIORITY_VALIDATION = 1
+LANE_NAMES = {PRIORITY_SUMMARY: "summary", PRIORITY_VALIDATION: "validation"}
+
+class LLMUnavailable(Exception):
+    """Raised when a call is shed: circuit open, queue full or deadline exceeded."""
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds, then lets a single probe call through (half-open).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def is_open(self) -> bool:
+        """True while failing fast; does not claim the half-open probe."""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+@dataclass(order=True)
+class _Call:
+    priority: int
+    seq: int
+    messages: List = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    deadline: float = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    call_type: str = field(compare=False)
+
+class LLMScheduler:
+    """
+    Single entry point for every Gemini call. Calls wait in priority lanes
+    (summaries ahead of validation checks), are paced by a token bucket sized
+    to the API quota, run under a concurrency cap with a per-call deadline,
+    and are retried with jittered backoff. A circuit breaker fails fast
+    during an outage instead of queueing more work.
+    """
+
+    def __init__(self, llm=None, requests_per_minute: float = 60, burst: int = 10, concurrency: int = 8,
+                 max_queue: int = 500, max_attempts: int = 3, base_backoff: float = 0.5,
+                 attempt_timeout: float = 20.0, breaker: Optional[CircuitBreaker] = None,
+                 llm_factory: Optional[Callable[[], object]] = None, router: Optional[ModelRouter] = None):
+        if router is None:
+            # Single route: every call type goes to the one client
+            router = ModelRouter({"default": ModelRoute("default", model="")}, {}, "default",
+                                 client_factory=lambda route: llm_factory())
+        self.router = router
+        if llm is not None:
+            router.override(llm)
+        self.bucket = TokenBucket(rate=requests_per_minute / 60.0, capacity=burst)
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.attempt_timeout = attempt_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.waits = defaultdict(lambda: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        self.outcomes = defaultdict(int)
+
+    @property
+    def llm(self):
+        """Client of the default route."""
+        return self.router.client_for(self.router.routes[self.router.default_route])
+
+    @llm.setter
+    def llm(self, value):
+        """Send every route to `value`, e.g. a fake model in tests and benchmarks."""
+        self.router.override(value)
+
+    def _ensure_started(self):
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker(), name=f"llm-worker-{i}") for i in range(self.concurrency)]
+
+    async def close(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def ainvoke(self, messages: List, priority: int = PRIORITY_VALIDATION, deadline: float = 30.0,
+                      call_type: Optional[str] = None):
+        """
+        Schedule `llm.ainvoke(messages)`; `deadline` is the total seconds allowed, queueing included.
+        `call_type` labels latency and token metrics and defaults to the lane name.
+        """
+        if self.breaker.is_open():
+            self.outcomes["circuit_open"] += 1
+            raise LLMUnavailable("LLM circuit is open")
+        self._ensure_started()
+        if self._queue.qsize() >= self.max_queue:
+            self.outcomes["queue_full"] += 1
+            raise LLMUnavailable("LLM queue is full")
+
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        call_type = call_type or LANE_NAMES.get(priority, str(priority))
+        self._queue.put_nowait(_Call(priority, next(self._seq), messages, future, now + deadline, now, call_type))
+        try:
+            # The deadline covers time spent queued too; on timeout the future is cancelled and workers skip it
+            return await asyncio.wait_for(future, deadline)
+        except asyncio.TimeoutError:
+            self.outcomes["deadline"] += 1
+            raise LLMUnavailable(f"LLM deadline exceeded ({call_type})")
+
+    async def _worker(self):
+        while True:
+            call = await self._queue.get()
+            if call.future.done():
+                continue
+            try:
+                result = await self._run(call)
+                if not call.future.done():
+                    call.future.set_result(result)
+            except asyncio.CancelledError:
+                if not call.future.done():
+                    call.future.cancel()
+                raise
+            except Exception as e:
+                if not call.future.done():
+                    call.future.set_exception(e)
+
+    async def _run(self, call: _Call):
+        lane = LANE_NAMES.get(call.priority, str(call.priority))
+        if call.deadline <= time.monotonic():
+            # Don't spend a rate-limit token on a call its caller has already given up on
+            raise LLMUnavailable(f"LLM deadline exceeded ({lane})")
+
+        route = self.router.route_for(call.call_type)
+        last_error = None
+        self.in_flight += 1
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                # Every attempt is a request to the provider, so retries spend tokens too
+                waited = await self.bucket.acquire()
+                if attempt == 1:
+                    waited += time.monotonic() - call.enqueued_at
+                stats = self.waits[lane]
+                stats["count"] += 1
+                stats["total_seconds"] += waited
+                stats["max_seconds"] = max(stats["max_seconds"], waited)
+
+                remaining = call.deadline - time.monotonic()
+                if remaining <= 0:
+                    if not call.future.done():
+                        # Otherwise ainvoke has already counted it and given up waiting
+                        self.outcomes["deadline"] += 1
+                    raise LLMUnavailable(f"LLM deadline exceeded ({lane})") from last_error
+                if not self.breaker.allow():
+                    self.outcomes["circuit_open"] += 1
+                    raise LLMUnavailable("LLM circuit is open") from last_error
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        self.router.client_for(route).ainvoke(call.messages),
+                        timeout=min(self.attempt_timeout, remaining)
+                    )
+                    self.breaker.record_success()
+                    self.outcomes["ok"] += 1
+                    elapsed = time.perf_counter() - started
+                    usage = getattr(response, "usage_metadata", None)
+                    llm_call_seconds.observe(elapsed, call_type=call.call_type)
+                    record_llm_usage(call.call_type, usage)
+                    self.router.record(route, elapsed, usage)
+                    return response
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    last_error = e
+                    llm_call_seconds.observe(time.perf_counter() - started, call_type=call.call_type)
+                    self.breaker.record_failure()
+                    self.outcomes["error"] += 1
+                    if attempt < self.max_attempts:
+                        # Full jitter so retries from many callers don't line up
+                        await asyncio.sleep(random.uniform(0, self.base_backoff * (2 ** attempt)))
+            raise LLMUnavailable(f"LLM call failed after {self.max_attempts} attempts: {last_error}") from last_error
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "queue_depth": self.queue_depth(),
+            "in_flight": self.in_flight,
+            "circuit": self.breaker.state,
+            "outcomes": dict(self.outcomes),
+            "routes": self.router.stats(),
+            "waits": {
+                lane: {**w, "avg_seconds": w["total_seconds"] / w["count"] if w["count"] else 0.0}
+                for lane, w in self.waits.items()
+            },
+        }
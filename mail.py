@@ -1,79 +1,175 @@
 # mail.py
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+import asyncio
+import random
+from datetime import datetime, timedelta
 from typing import List
+
+import httpx
 from dotenv import load_dotenv
 import os
-import ssl
-import requests
+
+from metrics import span
 
 # Load environment variables from .env file
 load_dotenv()
 
-class EmailSender:
-    def __init__(self, from_email: str):
-        """
-        Initialize the EmailSender with SendGrid API key from .env and sender email
-        """
-        api_key = os.getenv('SENDGRID_API_KEY')
-        if not api_key:
-            raise ValueError("SENDGRID_API_KEY not found in .env file")
-            
-        # Initialize SendGrid client
-        session = requests.Session()
-        session.verify = False
-        self.client = SendGridAPIClient(api_key=api_key, http_client=session)
+SENDGRID_API_URL = os.getenv('SENDGRID_API_URL', 'https://api.sendgrid.com')
+
+class SendGridClient:
+    """
+    Async SendGrid v3 client over a pooled keep-alive connection, opened on first use.
+    Point `base_url` at a local fake endpoint for tests.
+    """
+
+    def __init__(self, api_key: str, from_email: str, base_url: str = SENDGRID_API_URL,
+                 max_connections: int = 10, timeout: float = 10.0, transport: httpx.AsyncBaseTransport = None):
+        self.api_key = api_key
         self.from_email = from_email
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.transport = transport
+        self.client = None
 
-    def send_email(self, to_emails: List[str], subject: str, content: str, is_html: bool = True) -> bool:
-        """
-        Send an email to one or more recipients
-        """
-        try:
-            # Create the email message
-            message = Mail(
-                from_email=self.from_email,
-                to_emails=to_emails,
-                subject=subject,
-                html_content=content if is_html else None,
-                plain_text_content=None if is_html else content
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            if not self.api_key:
+                raise ValueError("SENDGRID_API_KEY is not set")
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=self.timeout,
+                transport=self.transport
             )
-            
-            # Send the email
-            response = self.client.send(message)
-            
-            # Check if send was successful
-            if response.status_code in [200, 201, 202]:
-                print(f"✓ Email sent successfully to {', '.join(to_emails)}")
-                return True
-            else:
-                print(f"⨯ Failed to send email. Status code: {response.status_code}")
-                return False
-                
+        return self.client
+
+    async def send(self, to_emails: List[str], subject: str, html_content: str):
+        """Send one email; raises on transport errors and non-2xx responses."""
+        response = await self.get_client().post("/v3/mail/send", json={
+            "personalizations": [{"to": [{"email": email} for email in to_emails]}],
+            "from": {"email": self.from_email},
+            "subject": subject,
+            "content": [{"type": "text/html", "value": html_content}],
+        })
+        if response.status_code not in (200, 201, 202):
+            raise RuntimeError(f"SendGrid returned {response.status_code}: {response.text[:200]}")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+class EmailOutboxDrainer:
+    """
+    Background task that delivers rows from the `email_outbox` table. Emails that
+    become due close together are claimed as one batch and sent concurrently over
+    the pooled client; failures are rescheduled with exponential backoff and parked
+    as 'failed' after `max_attempts`, so nothing is dropped.
+    """
+
+    def __init__(self, db_manager, client: SendGridClient, batch_size: int = 20, batch_window: float = 0.5,
+                 poll_interval: float = 30.0, max_attempts: int = 8, base_backoff: float = 30.0,
+                 max_backoff: float = 3600.0):
+        self.db_manager = db_manager
+        self.client = client
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+
+    def notify(self):
+        """Wake the drainer after a new outbox row has been committed."""
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="email-outbox-drainer")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                # Give consultations finishing together a moment to land in the same batch
+                await asyncio.sleep(self.batch_window)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self.drain_once() == self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Email outbox drain error: {str(e)}")
+
+    async def drain_once(self) -> int:
+        emails = await self.db_manager.claim_due_emails(limit=self.batch_size)
+        if emails:
+            self.batches += 1
+            await asyncio.gather(*(self._deliver(email) for email in emails))
+        return len(emails)
+
+    async def _deliver(self, email):
+        try:
+            with span("email_send"):
+                await self.client.send(email.to_emails.split(","), email.subject, email.html_content)
         except Exception as e:
-            print(f"⨯ Error sending email: {str(e)}")
-            return False
+            attempts = email.attempts + 1
+            retry_at = None
+            if attempts < self.max_attempts:
+                delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+                retry_at = datetime.utcnow() + timedelta(seconds=delay + random.uniform(0, delay / 4))
+            print(f"⨯ Email {email.id} to {email.to_emails} failed (attempt {attempts}): {str(e)}")
+            self.failed += 1
+            await self.db_manager.mark_email_failed(email.id, str(e), retry_at)
+            return
+        print(f"✓ Email {email.id} sent successfully to {email.to_emails}")
+        self.sent += 1
+        await self.db_manager.mark_email_sent(email.id)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "failed": self.failed, "batches": self.batches}
 
 if __name__ == "__main__":
-    try:
+    async def send_test_email():
         # Example usage
-        sender = EmailSender(
+        sender = SendGridClient(
+            api_key=os.getenv('SENDGRID_API_KEY'),
             from_email='iam@robosushie.com'
         )
-        
+
         # Example HTML email
         html_content = """
         <h2>Test Email</h2>
         <p>This is a test email sent using SendGrid.</p>
         <p><em>Have a great day!</em></p>
         """
-        
-        # Send the email
-        sender.send_email(
-            to_emails=['ssamuel.sushant@gmail.com'],
-            subject='Test Email from SendGrid',
-            content=html_content,
-            is_html=True
-        )
-    except Exception as e:
-        print(f"Error: {str(e)}")
\ No newline at end of file
+
+        try:
+            await sender.send(
+                to_emails=['ssamuel.sushant@gmail.com'],
+                subject='Test Email from SendGrid',
+                html_content=html_content
+            )
+            print("✓ Test email sent")
+        except Exception as e:
+            print(f"Error: {str(e)}")
+        finally:
+            await sender.close()
+
+    asyncio.run(send_test_email())
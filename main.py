@@ -1,282 +1,791 @@
-from fastapi import FastAPI, Request, Response
+from startup import startup_report
 
-from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
+with startup_report.measure("import", "fastapi"):
+    from fastapi import FastAPI, Request, Response
+    from fastapi.responses import JSONResponse, PlainTextResponse
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage
+with startup_report.measure("import", "twilio.twiml"):
+    from twilio.twiml.messaging_response import MessagingResponse
 
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, To, Content
+with startup_report.measure("import", "langchain_core"):
+    from langchain_core.messages import HumanMessage, SystemMessage
 
-from typing import List
+from contextlib import asynccontextmanager
+import asyncio
 import json
+import time
+from typing import List, Optional
 
-from db import init_db, db_manager
-from config import GOOGLE_API_KEY, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, SENDGRID_API_KEY
+with startup_report.measure("import", "app modules"):
+    from db import init_db, db_manager, get_engine, ConsultationRecord, ConsultationWriter, OutboxEmail
+    from metrics import registry, span, validation_decisions
+    from mail import SendGridClient, EmailOutboxDrainer
+    from whatsapp import DeliveryUnknown, WhatsAppGateway
+    from pipeline import CompletionJob, CompletionPipeline, PipelineFull, StageFailed
+    from session_store import SessionReaper, build_session_store
+    from verdict_cache import VerdictCache, fingerprint
+    from dedup import MessageDedupCache
+    from sender_locks import KeyedLock
+    from prompts import PromptBuilder, compact_json
+    from microbatch import MicroBatcher
+    from history import router as history_router
+    from profile_cache import ProfileCache, prefill_outcomes
+    from model_router import ModelRoute, ModelRouter, OfflineLLM
+    from llm_scheduler import LLMScheduler, CircuitBreaker, PRIORITY_SUMMARY, PRIORITY_VALIDATION
+    from summaries import (
+        FENCE_RE, STRUCTURED_SUMMARY_PROMPT, URGENCY_IMMEDIATE, SummaryStats, parse_structured_summary, split_urgency
+    )
+    from questionnaire import QuestionnaireLoader, Questionnaire, Step
+    from validators import ValidatorRegistry, VALID, INVALID, is_affirmative
+    from config import (
+        GOOGLE_API_KEY, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, SENDGRID_API_KEY,
+        COMPLETION_WORKERS, COMPLETION_QUEUE_SIZE, COMPLETION_MAX_ATTEMPTS,
+        EMAIL_BATCH_SIZE, EMAIL_POLL_INTERVAL, EMAIL_MAX_ATTEMPTS,
+        SESSION_STORE, SESSION_DB_PATH, SESSION_TTL, SESSION_MAX,
+        VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL, VERDICT_CACHE_PATH, SUMMARY_MODE,
+        LLM_REQUESTS_PER_MINUTE, LLM_BURST, LLM_CONCURRENCY, LLM_MAX_QUEUE, LLM_MAX_ATTEMPTS, LLM_ATTEMPT_TIMEOUT,
+        LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET, LLM_VALIDATION_DEADLINE, LLM_SUMMARY_DEADLINE,
+        HEALTH_DB_TIMEOUT, DB_CREATE_TABLES, PREWARM_CLIENTS, PREWARM_DB_CONNECTIONS,
+        DEDUP_MAX_ENTRIES, DEDUP_TTL, PROMPT_BUDGET_VALIDATION, PROMPT_BUDGET_SUMMARY,
+        DB_WRITE_BATCH_WINDOW, DB_WRITE_BATCH_MAX, PROFILE_PREFILL, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL,
+        SESSION_IDLE_TTL, SESSION_REAP_INTERVAL, SESSION_EXPIRY_NOTICE,
+        LLM_PROVIDER, LLM_VALIDATION_MODEL, LLM_VALIDATION_MAX_TOKENS,
+        LLM_SUMMARY_MODEL, LLM_SUMMARY_TEMPERATURE, LLM_SUMMARY_MAX_TOKENS,
+        VALIDATION_BATCH_WINDOW, VALIDATION_BATCH_MAX, QUESTIONNAIRE_PATH, QUESTIONNAIRE_RELOAD_INTERVAL,
+        TWILIO_API_URL, WHATSAPP_MESSAGES_PER_SECOND, WHATSAPP_BURST, WHATSAPP_RECIPIENT_PER_MINUTE,
+        WHATSAPP_RECIPIENT_BURST, WHATSAPP_MAX_ATTEMPTS
+    )
 
-# Initialize database
-init_db()
+# Clients are built on first use (or during startup when PREWARM_CLIENTS is set),
+# so importing this module stays offline and cheap
+def build_llm_client(route: ModelRoute):
+    if LLM_PROVIDER == "offline":
+        return OfflineLLM(route)
+    with startup_report.measure("import", "langchain_google_genai"):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=route.model,
+        google_api_key=GOOGLE_API_KEY,
+        temperature=route.temperature,
+        max_output_tokens=route.max_output_tokens,
+        # LLMScheduler owns retries, so each attempt is rate limited and counted once
+        max_retries=0
+    )
 
-app = FastAPI()
+# Relevance checks only need one short token back; summaries get the quality-tuned model
+VALIDATION_ROUTE = ModelRoute("fast", LLM_VALIDATION_MODEL, temperature=0.0,
+                              max_output_tokens=LLM_VALIDATION_MAX_TOKENS)
+# Batched checks answer with one short JSON entry per item
+VALIDATION_BATCH_ROUTE = ModelRoute("fast_batch", LLM_VALIDATION_MODEL, temperature=0.0,
+                                    max_output_tokens=6 * VALIDATION_BATCH_MAX + 8)
+SUMMARY_ROUTE = ModelRoute("quality", LLM_SUMMARY_MODEL, temperature=LLM_SUMMARY_TEMPERATURE,
+                           max_output_tokens=LLM_SUMMARY_MAX_TOKENS)
+model_router = ModelRouter(
+    routes={route.name: route for route in (VALIDATION_ROUTE, VALIDATION_BATCH_ROUTE, SUMMARY_ROUTE)},
+    call_types={"validation": VALIDATION_ROUTE.name, "validation_batch": VALIDATION_BATCH_ROUTE.name},
+    default_route=SUMMARY_ROUTE.name,
+    client_factory=build_llm_client
+)
+
+# Every Gemini call goes through the scheduler: quota pacing, priority lanes, retries, circuit breaker
+llm_scheduler = LLMScheduler(
+    router=model_router,
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    burst=LLM_BURST,
+    concurrency=LLM_CONCURRENCY,
+    max_queue=LLM_MAX_QUEUE,
+    max_attempts=LLM_MAX_ATTEMPTS,
+    attempt_timeout=LLM_ATTEMPT_TIMEOUT,
+    breaker=CircuitBreaker(failure_threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET)
+)
+
+# The questionnaire is compiled from QUESTIONNAIRE_PATH and reloaded when the file changes
+questionnaires = QuestionnaireLoader(QUESTIONNAIRE_PATH, interval=QUESTIONNAIRE_RELOAD_INTERVAL)
+
+# Patient columns a returning patient can confirm instead of answering again, with display labels
+PROFILE_FIELDS = {"name": "Name", "age": "Age", "blood_group": "Blood group", "allergies": "Allergies", "email": "Email"}
+
+# Counts rule outcomes per step; the rules themselves are resolved when the questionnaire is compiled
+validator_registry = ValidatorRegistry()
+
+SYSTEM_PROMPT = """You are a medical consultation chatbot. 
+            Your role is to gather information from patients and provide initial 
+            assessments while maintaining a professional and caring demeanor."""
 
-# Initialize Twilio client
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+VALIDATION_PROMPT = """
+                Quick check - is this answer somewhat relevant to the question: "{question}"
+                Answer: "{answer}"
+                If it's completely irrelevant, respond with #INCORRECT#.
+                Otherwise respond with #VALID#.
+                Keep it simple, no explanations needed.
+                """
+
+VALIDATION_BATCH_PROMPT = """
+                Quick check - for each numbered answer below, is it somewhat relevant to its question?
+                Questions: {questions}
+                Answers: {details}
+                Respond with only a JSON array with one entry per answer, in order:
+                "INCORRECT" if the answer is completely irrelevant, otherwise "VALID".
+                """
 
-# Initialize LangChain with Gemini
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash",
-    google_api_key=GOOGLE_API_KEY,
-    temperature=0.7
+# Per-call-type input token budgets; free-text answers are truncated to fit
+prompt_builder = PromptBuilder(
+    budgets={
+        "validation": PROMPT_BUDGET_VALIDATION,
+        "validation_batch": PROMPT_BUDGET_VALIDATION * VALIDATION_BATCH_MAX,
+        "summary_structured": PROMPT_BUDGET_SUMMARY,
+        "summary_patient": PROMPT_BUDGET_SUMMARY,
+        "summary_doctor": PROMPT_BUDGET_SUMMARY,
+    },
+    system_prompt=SYSTEM_PROMPT
 )
+SYSTEM_MESSAGE = SystemMessage(content=prompt_builder.system_prompt)
 
-MEDICAL_QUESTIONS = [
-    "What is your name?",
-    "What is your age?",
-    "What is your blood group?",
-    "Do you have any known allergies? If yes, please list them.",
-    "What symptoms are you currently experiencing?",
-    "How long have you been experiencing these symptoms?",
-    "Are you currently taking any medications? If yes, please list them.",
-    "Do you have any previous medical conditions or surgeries?",
-    "Have you experienced these symptoms before?",
-    "Do you have an email address? If yes, please enter you email address, else enter no/No"
-]
-
-class EmailService:
-    def __init__(self, api_key: str, from_email: str):
-        self.from_email = from_email
-        self.client = SendGridAPIClient(api_key=api_key)
-
-    async def send_email(self, to_emails: List[str], subject: str, content: str) -> bool:
-        try:
-            message = Mail(
-                from_email=self.from_email,
-                to_emails=[To(email) for email in to_emails],
-                subject=subject,
-                html_content=Content("text/html", content)
-            )
-            
-            response = self.client.send(message)
-            
-            if response.status_code not in [200, 201, 202]:
-                print(f"Email send failed with status code: {response.status_code}")
-                return False
-                
-            print(f"Email sent successfully to {to_emails}")
-            return True
-            
-        except Exception as e:
-            print(f"Error sending email: {str(e)}")
-            return False
+# LLM relevance verdicts, invalidated whenever the prompts or models of either the
+# single or the batched check change, since verdicts from both land in the same cache
+verdict_cache = VerdictCache(
+    namespace=fingerprint(str(VALIDATION_ROUTE), str(VALIDATION_BATCH_ROUTE), SYSTEM_PROMPT, VALIDATION_PROMPT,
+                          VALIDATION_BATCH_PROMPT),
+    max_entries=VERDICT_CACHE_SIZE,
+    ttl=VERDICT_CACHE_TTL,
+    path=VERDICT_CACHE_PATH
+)
+
+# Latency and token usage of the single-call and two-call summary modes
+summary_stats = SummaryStats()
+
+async def check_relevance(item) -> bool:
+    """One LLM relevance check for a (step, answer) pair."""
+    step, answer = item
+    response = await llm_scheduler.ainvoke(
+        [SYSTEM_MESSAGE, HumanMessage(content=prompt_builder.render(
+            "validation", VALIDATION_PROMPT, question=step.question, answer=answer
+        ))],
+        priority=PRIORITY_VALIDATION,
+        deadline=LLM_VALIDATION_DEADLINE,
+        call_type="validation"
+    )
+    return "#VALID#" in response.content.upper()
+
+def parse_batch_verdicts(text: str, count: int) -> list:
+    """Parse a batched relevance reply; raises ValueError unless it holds exactly `count` verdicts."""
+    verdicts = json.loads(FENCE_RE.sub("", text.strip()))
+    if not isinstance(verdicts, list) or len(verdicts) != count:
+        raise ValueError(f"expected a JSON array of {count} verdicts")
+    parsed = []
+    for verdict in verdicts:
+        verdict = str(verdict).upper()
+        if "INCORRECT" in verdict:
+            parsed.append(False)
+        elif "VALID" in verdict:
+            parsed.append(True)
+        else:
+            raise ValueError(f"unrecognised verdict: {verdict}")
+    return parsed
+
+async def check_relevance_batch(items) -> list:
+    """Several relevance checks, possibly from different senders, in one structured LLM call."""
+    questions = {}
+    answers = {}
+    for n, (step, answer) in enumerate(items, 1):
+        questions[step.key] = step.question
+        answers[f"{n}:{step.key}"] = answer
+    response = await llm_scheduler.ainvoke(
+        [SYSTEM_MESSAGE, HumanMessage(content=prompt_builder.render(
+            "validation_batch", VALIDATION_BATCH_PROMPT, answers, questions=compact_json(questions)
+        ))],
+        priority=PRIORITY_VALIDATION,
+        deadline=LLM_VALIDATION_DEADLINE,
+        call_type="validation_batch"
+    )
+    return parse_batch_verdicts(response.content, len(items))
+
+# Relevance checks arriving within VALIDATION_BATCH_WINDOW of each other share one LLM call
+relevance_batcher = MicroBatcher(
+    "validation",
+    run_batch=check_relevance_batch,
+    run_single=check_relevance,
+    window=VALIDATION_BATCH_WINDOW,
+    max_items=VALIDATION_BATCH_MAX
+)
 
 class ChatSession:
-    def __init__(self):
-        self.current_question = 0
+    """
+    Per-sender questionnaire state. Slotted and kept small because every open
+    conversation holds one; LLM calls share the module-level SYSTEM_MESSAGE rather
+    than each session carrying its own message list. Answers are keyed by step id,
+    and a session keeps the questionnaire version it started on even if the file
+    is reloaded mid-conversation.
+    """
+    __slots__ = ("questionnaire", "step_id", "answers", "conversation_end", "clarification_asked", "pending_profile")
+
+    def __init__(self, questionnaire: Questionnaire = None):
+        self.questionnaire = questionnaire or questionnaires.current
+        # Step being asked; None once every step is answered or skipped
+        self.step_id = self.questionnaire.steps[0].id
         self.answers = {}
         self.conversation_end = False
-        self.clarification_asked = set()
-        self.messages = [
-            SystemMessage(content="""You are a medical consultation chatbot. 
-            Your role is to gather information from patients and provide initial 
-            assessments while maintaining a professional and caring demeanor.""")
-        ]
+        # Step ids already re-asked once; a tuple since it holds at most a few entries
+        self.clarification_asked = ()
+        # Stored profile answers (by step id) awaiting the returning patient's confirmation
+        self.pending_profile = None
 
-    async def validate_answer(self, question: str, answer: str) -> tuple[bool, str]:
-        if question in self.clarification_asked and answer.strip():
+    # Bump when the serialized layout changes; older states are discarded on load
+    STATE_VERSION = 2
+
+    def dumps(self) -> bytes:
+        """Compact versioned encoding for shared session stores; the questionnaire is stored by version."""
+        state = {
+            "v": self.STATE_VERSION,
+            "qv": self.questionnaire.version,
+            "s": self.step_id,
+            "a": list(self.answers.items()),
+            "c": list(self.clarification_asked),
+            "e": int(self.conversation_end),
+            "p": list((self.pending_profile or {}).items()),
+        }
+        return json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode()
+
+    @classmethod
+    def loads(cls, data: bytes) -> "ChatSession":
+        state = json.loads(data)
+        if state.get("v") != cls.STATE_VERSION:
+            raise ValueError(f"Unsupported session state version: {state.get('v')}")
+
+        # Another worker may have started this conversation on a version this one doesn't hold;
+        # step ids are stable across versions, so answers carry over and unknown steps are dropped
+        session = cls(questionnaires.get(state["qv"]))
+        steps = session.questionnaire.by_id
+        session.answers = {step_id: a for step_id, a in state["a"] if step_id in steps}
+        session.clarification_asked = tuple(step_id for step_id in state["c"] if step_id in steps)
+        session.conversation_end = bool(state["e"])
+        session.pending_profile = {step_id: a for step_id, a in state.get("p", []) if step_id in steps} or None
+        session.step_id = state["s"]
+        if session.step_id is not None:
+            session.advance()
+        return session
+
+    @property
+    def step(self) -> Optional[Step]:
+        return self.questionnaire.by_id.get(self.step_id)
+
+    def advance(self):
+        """Move to the next step still to be asked, past answered (e.g. confirmed profile) and skipped ones."""
+        step = self.questionnaire.next_step(self.step_id, self.answers)
+        self.step_id = step.id if step else None
+
+    async def validate_answer(self, step: Step, answer: str) -> tuple[bool, str]:
+        if step.id in self.clarification_asked and answer.strip():
             return True, ""
 
         if not answer.strip():
             return False, "Please provide a response."
 
+        with span("validation_rule"):
+            result = validator_registry.check(step.key, answer, step.rule)
+        if result.verdict == VALID:
+            validation_decisions.inc(question=step.key, source="rule")
+            return True, ""
+        if result.verdict == INVALID:
+            validation_decisions.inc(question=step.key, source="rule")
+            if step.id not in self.clarification_asked:
+                self.clarification_asked += (step.id,)
+                return False, result.message
+            return True, ""
+
         try:
-            if question == "What's your age?":
-                if not answer.replace('years', '').replace('old', '').strip().isdigit():
-                    if question not in self.clarification_asked:
-                        self.clarification_asked.add(question)
-                        return False, "Please provide your age in years."
-                    return True, ""
-
-            elif question == "What symptoms are you currently experiencing?":
-                if len(answer.split()) < 2 and question not in self.clarification_asked:
-                    self.clarification_asked.add(question)
-                    return False, "Please briefly describe what health issues you're experiencing."
-                return True, ""
-
-            response = await llm.ainvoke(
-                self.messages + [HumanMessage(content=f"""
-                Quick check - is this answer somewhat relevant to the question: "{question}"
-                Answer: "{answer}"
-                If it's completely irrelevant, respond with #INCORRECT#.
-                Otherwise respond with #VALID#.
-                Keep it simple, no explanations needed.
-                """)]
-            )
-            
-            is_valid = "#VALID#" in response.content.upper()
-            if not is_valid and question not in self.clarification_asked:
-                self.clarification_asked.add(question)
-                return False, f"Please provide a relevant answer to: {question}"
+            is_valid = verdict_cache.get(step.question, answer)
+            if is_valid is None:
+                with span("validation_llm"):
+                    if VALIDATION_BATCH_WINDOW > 0:
+                        is_valid = await relevance_batcher.submit((step, answer))
+                    else:
+                        is_valid = await check_relevance((step, answer))
+                verdict_cache.put(step.question, answer, is_valid)
+                validation_decisions.inc(question=step.key, source="llm")
+            else:
+                validation_decisions.inc(question=step.key, source="cache")
+
+            if not is_valid and step.id not in self.clarification_asked:
+                self.clarification_asked += (step.id,)
+                return False, f"Please provide a relevant answer to: {step.question}"
             return True, ""
 
-        except Exception:
+        except Exception as e:
+            # Don't hold the patient up when Gemini is unavailable; accept and move on
+            validation_decisions.inc(question=step.key, source="fallback")
+            print(f"Validation check skipped for '{step.key}': {str(e)}")
             return True, ""
 
+    async def _summary_call(self, call_type: str, template: str, **fields: str):
+        prompt = prompt_builder.render(call_type, template, self.questionnaire.keyed(self.answers), **fields)
+        return await llm_scheduler.ainvoke(
+            [SYSTEM_MESSAGE, HumanMessage(content=prompt)],
+            priority=PRIORITY_SUMMARY,
+            deadline=LLM_SUMMARY_DEADLINE,
+            call_type=call_type
+        )
+
     async def generate_summary(self) -> str:
-        try:
-            response = await llm.ainvoke(
-                self.messages + [HumanMessage(content=f"""
-                Based on this consultation, provide:
-                1. Brief summary of condition
-                2. Basic recommendations
-                3. Whether immediate medical attention is needed
-                
-                Details: {json.dumps(self.answers, indent=2)}
-                
-                Keep it simple and clear.
-                """)]
-            )
-            return response.content
-        except Exception:
-            return "Unable to generate summary. Please contact medical support."
+        with span("summary_patient"):
+            response = await self._summary_call("summary_patient", """
+            Based on this consultation, provide:
+            1. Brief summary of condition
+            2. Basic recommendations
+            3. Whether immediate medical attention is needed
+            
+            Details: {details}
+            
+            Keep it simple and clear. End with a last line that is exactly one of
+            "Urgency: immediate", "Urgency: soon" or "Urgency: routine".
+            """)
+        summary_stats.record_call("dual", response.usage_metadata)
+        return response.content
 
     async def generate_doctor_summary(self, patient_summary: str) -> str:
-        try:
-            response = await llm.ainvoke(
-                self.messages + [HumanMessage(content=f"""
-                Create a clinical summary:
-                1. Patient condition overview
-                2. Key symptoms and duration
-                3. Relevant medical history
-                4. Recommendations
-                
-                Patient Details: {json.dumps(self.answers, indent=2)}
-                Patient Summary: {patient_summary}
-                """)]
-            )
-            return response.content
-        except Exception:
-            return "Error generating medical summary."
-
-# In-memory storage for chat sessions
-chat_sessions = {}
-
-# Initialize email service
-email_service = EmailService(
+        with span("summary_doctor"):
+            response = await self._summary_call("summary_doctor", """
+            Create a clinical summary:
+            1. Patient condition overview
+            2. Key symptoms and duration
+            3. Relevant medical history
+            4. Recommendations
+            
+            Patient Details: {details}
+            Patient Summary: {patient_summary}
+            """, patient_summary=patient_summary)
+        summary_stats.record_call("dual", response.usage_metadata)
+        return response.content
+
+    async def generate_summaries(self, mode: str = SUMMARY_MODE) -> dict:
+        """
+        Patient summary, doctor summary and urgency. In "single" mode all three come
+        from one structured call; if that response can't be parsed we fall back to
+        the two-call path.
+        """
+        if mode == "single":
+            started = time.perf_counter()
+            with span("summary_structured"):
+                response = await self._summary_call("summary_structured", STRUCTURED_SUMMARY_PROMPT)
+            summary_stats.record_call("single", response.usage_metadata)
+            try:
+                summaries = parse_structured_summary(response.content)
+                summary_stats.record_run("single", time.perf_counter() - started)
+                return summaries
+            except ValueError as e:
+                print(f"Structured summary unparseable, using two-call path: {str(e)}")
+                summary_stats.record_fallback("single")
+
+        started = time.perf_counter()
+        patient_summary, urgency = split_urgency(await self.generate_summary())
+        doctor_summary = await self.generate_doctor_summary(patient_summary)
+        summary_stats.record_run("dual", time.perf_counter() - started)
+        return {
+            "patient_summary": patient_summary,
+            "doctor_summary": doctor_summary,
+            "urgency": urgency,
+        }
+
+# Replies already sent, by Twilio MessageSid
+message_dedup = MessageDedupCache(max_entries=DEDUP_MAX_ENTRIES, ttl=DEDUP_TTL)
+
+async def load_profile(mobile_number: str):
+    patient = await db_manager.get_patient(mobile_number)
+    if patient is None:
+        return None
+    return {key: getattr(patient, key) for key in PROFILE_FIELDS}
+
+# Stored patient profiles by mobile number, invalidated when a consultation is saved
+profile_cache = ProfileCache(load_profile, max_entries=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+def profile_answers(questionnaire: Questionnaire, profile) -> dict:
+    """Answers a stored profile can fill in, keyed by step id; empty fields are asked as usual."""
+    if not profile:
+        return {}
+    return {
+        questionnaire.profile_steps[key].id: str(value)
+        for key, value in profile.items()
+        if key in questionnaire.profile_steps and value not in (None, "")
+        and not (key == "name" and value == "Unknown")
+    }
+
+def welcome_back_message(questionnaire: Questionnaire, pending_profile: dict) -> str:
+    steps = {key: step for key, step in questionnaire.profile_steps.items() if step.id in pending_profile}
+    name = pending_profile[steps["name"].id] if "name" in steps else None
+    details = "\n".join(f"{PROFILE_FIELDS[key]}: {pending_profile[step.id]}" for key, step in steps.items())
+    return (
+        f"Welcome back{', ' + name if name else ''}! We have these details on file:\n\n{details}\n\n"
+        "Reply YES if they are still correct, or NO to update them."
+    )
+
+# Serializes messages per sender so two deliveries never race on one ChatSession
+sender_locks = KeyedLock()
+
+# Storage for in-progress chat sessions
+session_store = build_session_store(
+    SESSION_STORE,
+    loads=ChatSession.loads,
+    path=SESSION_DB_PATH,
+    ttl=SESSION_TTL,
+    max_sessions=SESSION_MAX
+)
+
+# Initialize email delivery: clinician emails go through the durable outbox
+sendgrid_client = SendGridClient(
     api_key=SENDGRID_API_KEY,
     from_email='iam@robosushie.com'
 )
 
+# Outbound WhatsApp messages (summaries, expiry notices) over the Twilio REST API
+whatsapp_gateway = WhatsAppGateway(
+    account_sid=TWILIO_ACCOUNT_SID,
+    auth_token=TWILIO_AUTH_TOKEN,
+    from_number=TWILIO_PHONE_NUMBER,
+    base_url=TWILIO_API_URL,
+    account_rate=WHATSAPP_MESSAGES_PER_SECOND,
+    account_burst=WHATSAPP_BURST,
+    recipient_rate=WHATSAPP_RECIPIENT_PER_MINUTE / 60.0,
+    recipient_burst=WHATSAPP_RECIPIENT_BURST,
+    max_attempts=WHATSAPP_MAX_ATTEMPTS
+)
+email_drainer = EmailOutboxDrainer(
+    db_manager,
+    sendgrid_client,
+    batch_size=EMAIL_BATCH_SIZE,
+    poll_interval=EMAIL_POLL_INTERVAL,
+    max_attempts=EMAIL_MAX_ATTEMPTS
+)
+
+# Patient upsert + consultation insert in one transaction, optionally grouped across consultations
+consultation_writer = ConsultationWriter(db_manager, batch_window=DB_WRITE_BATCH_WINDOW, max_batch=DB_WRITE_BATCH_MAX)
+
+PATIENT_SUMMARY_FALLBACK = (
+    "We couldn't prepare your summary automatically right now. "
+    "Our medical team has your answers and will review them."
+)
+DOCTOR_SUMMARY_FALLBACK = "Error generating medical summary."
+
+async def summarize_stage(job: CompletionJob):
+    job.results.update(await job.session.generate_summaries())
+
+def clinician_email(job: CompletionJob) -> OutboxEmail:
+    session = job.session
+    name = session.questionnaire.record_fields(session.answers)["name"]
+    # Consultations flagged as needing immediate attention are marked in the subject line
+    prefix = "[URGENT] " if job.results.get("urgency") == URGENCY_IMMEDIATE else ""
+    return OutboxEmail(
+        to_emails=["ssamuel.sushant@gmail.com"],
+        subject=f"{prefix}Medical Consultation Summary - {name}",
+        html_content=f"""
+        <h2>Medical Consultation Summary</h2>
+        <p><strong>Patient Name:</strong> {name}</p>
+        <hr>
+        <h3>Doctor's Summary:</h3>
+        <p>{job.results.get("doctor_summary", DOCTOR_SUMMARY_FALLBACK)}</p>
+        <hr>
+        <h3>Raw Consultation Data:</h3>
+        <pre>{json.dumps(session.questionnaire.labelled(session.answers), indent=2)}</pre>
+        """
+    )
+
+async def persist_stage(job: CompletionJob):
+    session = job.session
+    # Patient info, the consultation and the clinician email's outbox row are written in one
+    # transaction, so the email is queued exactly when the consultation is stored
+    with span("db_consultation_write"):
+        job.results["consultation"] = await consultation_writer.save(ConsultationRecord(
+            mobile_number=job.sender,
+            **session.questionnaire.record_fields(session.answers),
+            patient_summary=job.results.get("patient_summary", PATIENT_SUMMARY_FALLBACK),
+            doctor_summary=job.results.get("doctor_summary", DOCTOR_SUMMARY_FALLBACK),
+            urgency=job.results.get("urgency"),
+            outbox_email=clinician_email(job)
+        ))
+    profile_cache.invalidate(job.sender)
+    email_drainer.notify()
+
+async def send_whatsapp(to: str, body: str, sent: Optional[List[str]] = None):
+    """
+    Send an outbound WhatsApp message outside of a webhook reply, split into parts if it
+    is too long. Pass the same `sent` list when retrying so delivered parts are skipped.
+    """
+    await whatsapp_gateway.send(to, body, sent)
+
+async def notify_patient_stage(job: CompletionJob):
+    final_msg = (
+        f"Consultation Summary:\n\n{job.results.get('patient_summary', PATIENT_SUMMARY_FALLBACK)}\n\n"
+        "Your consultation details have been sent to our medical team. "
+        "They will contact you if immediate attention is needed. "
+        "Say 'Hi' to start a new consultation."
+    )
+    # Kept on the job so a pipeline retry resumes at the first part Twilio hasn't accepted
+    sent = job.results.setdefault("whatsapp_sids", [])
+    try:
+        await send_whatsapp(job.sender, final_msg, sent)
+    except DeliveryUnknown as e:
+        # The gateway already retried what was safe to; another attempt could repeat this part
+        raise StageFailed(f"summary part {len(sent) + 1} may not have been delivered: {str(e)}")
+
+async def notify_session_expired(sender: str):
+    # A message being handled right now will save the session again; don't tell them it expired
+    if sender in sender_locks:
+        return
+    await send_whatsapp(
+        sender,
+        "Your consultation was closed after a period of inactivity. Say 'Hi' whenever you'd like to start again."
+    )
+
+# Drops conversations the patient abandoned part-way through
+session_reaper = SessionReaper(
+    session_store,
+    idle_ttl=SESSION_IDLE_TTL,
+    interval=SESSION_REAP_INTERVAL,
+    on_expired=notify_session_expired if SESSION_EXPIRY_NOTICE else None
+)
+
+# Summaries, persistence and notifications run after the webhook has replied
+completion_pipeline = CompletionPipeline(
+    stages=[
+        ("summarize", summarize_stage),
+        ("persist", persist_stage),
+        ("notify_patient", notify_patient_stage),
+    ],
+    workers=COMPLETION_WORKERS,
+    max_queue=COMPLETION_QUEUE_SIZE,
+    max_attempts=COMPLETION_MAX_ATTEMPTS
+)
+
+async def prewarm():
+    """Build every client and open DB pool connections before taking traffic."""
+    for resource in model_router.clients():
+        await asyncio.to_thread(resource.get)
+    with startup_report.measure("startup", "sendgrid_client"):
+        sendgrid_client.get_client()
+    with startup_report.measure("startup", "whatsapp_gateway"):
+        whatsapp_gateway.get_client()
+    with startup_report.measure("startup", f"db_pool x{PREWARM_DB_CONNECTIONS}"):
+        await asyncio.gather(*(db_manager.ping() for _ in range(PREWARM_DB_CONNECTIONS)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_CREATE_TABLES:
+        with startup_report.measure("startup", "init_db"):
+            await asyncio.to_thread(init_db)
+    if PREWARM_CLIENTS:
+        await prewarm()
+    await completion_pipeline.start()
+    email_drainer.start()
+    session_reaper.start()
+    questionnaires.start()
+    startup_report.log()
+
+    yield
+
+    await questionnaires.stop()
+    await session_reaper.stop()
+    await completion_pipeline.stop()
+    await consultation_writer.close()
+    await email_drainer.stop()
+    await sendgrid_client.close()
+    await whatsapp_gateway.close()
+    await relevance_batcher.close()
+    await llm_scheduler.close()
+    await session_store.close()
+    verdict_cache.save()
+
+app = FastAPI(lifespan=lifespan)
+# Clinician history and ops export endpoints (X-API-Key protected)
+app.include_router(history_router)
+
+def error_reply() -> str:
+    response = MessagingResponse()
+    response.message(
+        "I apologize, but I encountered an error. Please try again by saying 'Hi'."
+    )
+    return str(response)
+
 @app.post("/webhook")
 async def webhook(request: Request):
+    with span("webhook"):
+        try:
+            with span("form_parse"):
+                form_data = await request.form()
+        except Exception as e:
+            print(f"Webhook error: {str(e)}")
+            return Response(content=error_reply(), media_type="application/xml")
+
+        # Twilio retries reuse the MessageSid; replay the stored reply instead of reprocessing
+        twiml = await message_dedup.run(form_data.get('MessageSid'), lambda: handle_message(form_data))
+        return Response(content=twiml, media_type="application/xml")
+
+async def handle_message(form_data) -> str:
+    sender = form_data.get('From', '').replace('whatsapp:', '')
+    async with sender_locks.hold(sender):
+        return await process_message(sender, form_data)
+
+async def complete_session(sender: str, session: ChatSession, response: MessagingResponse,
+                           answered: Optional[int]) -> str:
+    """Hand a finished questionnaire to the completion pipeline; `answered` is the step just answered."""
+    try:
+        completion_pipeline.submit(CompletionJob(sender=sender, session=session))
+    except PipelineFull:
+        # Keep the last answer pending so the patient can resend it
+        if answered is not None:
+            session.answers.pop(answered, None)
+            session.step_id = answered
+        await session_store.save(sender, session)
+        response.message(
+            "We're handling a lot of consultations right now. "
+            "Please send your last answer again in a minute."
+        )
+        return str(response)
+
+    response.message(
+        "Thank you! We're preparing your consultation summary now. "
+        "You'll receive it here in a moment."
+    )
+    # session.conversation_end = True
+    await session_store.delete(sender)
+    return str(response)
+
+async def process_message(sender: str, form_data) -> str:
     try:
-        form_data = await request.form()
         # print(form_data)
         incoming_msg = form_data.get('Body', '').strip()
-        sender = form_data.get('From', '').replace('whatsapp:', '')
         
         response = MessagingResponse()
-        db = db_manager.get_db()
-        
-        if sender not in chat_sessions:
-            chat_sessions[sender] = ChatSession()
-            welcome_msg = (
-                "Hello! I'm your medical consultation bot. I'll ask you a few "
-                "questions to understand your condition better. Please answer them accurately.\n\n"
-                + MEDICAL_QUESTIONS[0]
-            )
-            response.message(welcome_msg)
-            return Response(content=str(response), media_type="application/xml")
         
-        session = chat_sessions[sender]
+        with span("session_lookup"):
+            session = await session_store.get(sender)
+
+        if session is None:
+            session = ChatSession(questionnaires.current)
+            if PROFILE_PREFILL:
+                try:
+                    with span("profile_lookup"):
+                        session.pending_profile = profile_answers(session.questionnaire, await profile_cache.get(sender))
+                except Exception as e:
+                    # Fall back to asking every question
+                    print(f"Profile lookup failed for {sender}: {str(e)}")
+            await session_store.save(sender, session)
+            if session.pending_profile:
+                response.message(welcome_back_message(session.questionnaire, session.pending_profile))
+                return str(response)
+            response.message(f"{session.questionnaire.welcome}\n\n{session.step.question}")
+            return str(response)
         
         if session.conversation_end:
             response.message("Your consultation has ended. Say 'Hi' to start a new consultation.")
-            return Response(content=str(response), media_type="application/xml")
+            return str(response)
+
+        if session.pending_profile:
+            # One turn confirms every stored field; anything but a yes re-asks them all
+            confirmed = is_affirmative(incoming_msg)
+            prefill_outcomes.inc(outcome="confirmed" if confirmed else "declined")
+            if confirmed:
+                session.answers.update(session.pending_profile)
+            session.pending_profile = None
+            session.advance()
+            # A returning patient can confirm their way past every step
+            if session.step is not None:
+                await session_store.save(sender, session)
+                response.message(
+                    ("Thank you for confirming.\n\n" if confirmed else "No problem, let's update your details.\n\n")
+                    + session.step.question
+                )
+                return str(response)
         
-        is_valid, validation_msg = await session.validate_answer(
-            MEDICAL_QUESTIONS[session.current_question],
-            incoming_msg
-        )
+        step = session.step
+        if step is None:
+            # Nothing left to ask, e.g. every step was filled from the confirmed profile
+            return await complete_session(sender, session, response, answered=None)
+
+        with span("validation"):
+            is_valid, validation_msg = await session.validate_answer(step, incoming_msg)
         
         if not is_valid:
+            await session_store.save(sender, session)
             response.message(validation_msg)
-            return Response(content=str(response), media_type="application/xml")
+            return str(response)
         
-        session.answers[MEDICAL_QUESTIONS[session.current_question]] = incoming_msg
-        session.current_question += 1
+        session.answers[step.id] = incoming_msg
+        session.advance()
         
-        if session.current_question < len(MEDICAL_QUESTIONS):
-            response.message(MEDICAL_QUESTIONS[session.current_question])
+        if session.step is not None:
+            await session_store.save(sender, session)
+            response.message(session.step.question)
         else:
-            # Generate summaries
-            patient_summary = await session.generate_summary()
-            doctor_summary = await session.generate_doctor_summary(patient_summary)
-            
-            try:
-                # Save patient info to database
-                patient = await db_manager.create_or_update_patient(
-                    db=db,
-                    mobile_number=sender,
-                    name=session.answers.get("What is your name?", "Unknown"),
-                    age=int(session.answers.get("What is your age?", "0").replace('years', '').strip()),
-                    blood_group=session.answers.get("What is your blood group?", None),
-                    allergies=session.answers.get("Do you have any known allergies? If yes, please list them.", None),
-                    email=session.answers.get("Do you have an email address? If yes, please enter you email address, else enter no/No", None)  
-                )
-                
-                # Save consultation to database
-                await db_manager.create_consultation(
-                    db=db,
-                    patient_id=patient.id,
-                    symptoms=session.answers.get("What symptoms are you currently experiencing?", ""),
-                    symptoms_duration=session.answers.get("How long have you been experiencing these symptoms?", ""),
-                    patient_summary=patient_summary,
-                    doctor_summary=doctor_summary
-                )
-            
-            except Exception as db_error:
-                print(f"Database error: {str(db_error)}")
-            
-            # Send email notification
-            email_sent = await email_service.send_email(
-                to_emails=["ssamuel.sushant@gmail.com"],
-                subject=f"Medical Consultation Summary - {session.answers.get('What is your name?', 'Patient')}",
-                content=f"""
-                <h2>Medical Consultation Summary</h2>
-                <p><strong>Patient Name:</strong> {session.answers.get('What is your name?', 'Unknown')}</p>
-                <hr>
-                <h3>Doctor's Summary:</h3>
-                <p>{doctor_summary}</p>
-                <hr>
-                <h3>Raw Consultation Data:</h3>
-                <pre>{json.dumps(session.answers, indent=2)}</pre>
-                """
-            )
-            
-            if not email_sent:
-                print("Failed to send email notification")
-            
-            final_msg = (
-                f"Consultation Summary:\n\n{patient_summary}\n\n"
-                "Your consultation details have been sent to our medical team. "
-                "They will contact you if immediate attention is needed. "
-                "Say 'Hi' to start a new consultation."
-            )
-            response.message(final_msg)
-            # session.conversation_end = True
-            del chat_sessions[sender]
+            return await complete_session(sender, session, response, answered=step.id)
         
-        return Response(content=str(response), media_type="application/xml")
+        return str(response)
             
     except Exception as e:
         print(f"Webhook error: {str(e)}")
-        response = MessagingResponse()
-        response.message(
-            "I apologize, but I encountered an error. Please try again by saying 'Hi'."
-        )
-        return Response(content=str(response), media_type="application/xml")
+        return error_reply()
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+registry.gauge("healthbot_llm_queue_depth", "LLM calls waiting for a scheduler slot.",
+               lambda: [({}, llm_scheduler.queue_depth())])
+registry.gauge("healthbot_llm_in_flight", "LLM calls currently running.",
+               lambda: [({}, llm_scheduler.in_flight)])
+registry.gauge("healthbot_llm_circuit_state", "LLM circuit breaker: 0 closed, 1 half-open, 2 open.",
+               lambda: [({}, CIRCUIT_STATES[llm_scheduler.breaker.state])])
+registry.gauge("healthbot_llm_wait_seconds_avg", "Average LLM queue wait per lane.",
+               lambda: [({"lane": lane}, w["avg_seconds"]) for lane, w in llm_scheduler.stats()["waits"].items()])
+registry.gauge("healthbot_llm_route_seconds_avg", "Average successful LLM call latency per model route.",
+               lambda: [({"route": route}, t["avg_seconds"]) for route, t in model_router.stats().items()])
+registry.gauge("healthbot_summary", "Summary runs, LLM calls, tokens, fallbacks and average latency per summary mode.",
+               lambda: [({"mode": mode, "stat": k}, v) for mode, stats in summary_stats.snapshot().items()
+                        for k, v in stats.items()])
+registry.gauge("healthbot_completion_queue_depth", "Consultations waiting for the completion pipeline.",
+               lambda: [({}, completion_pipeline.depth())])
+registry.gauge("healthbot_verdict_cache", "Verdict cache size and lookup totals.",
+               lambda: [({"stat": k}, v) for k, v in verdict_cache.stats().items()])
+registry.gauge("healthbot_llm_calls_avoided", "Answers settled by a local rule instead of Gemini.",
+               lambda: [({"question": key}, c["llm_avoided"]) for key, c in validator_registry.stats().items()])
+registry.gauge("healthbot_emails", "Clinician emails delivered or failed by this worker.",
+               lambda: [({"outcome": k}, v) for k, v in email_drainer.stats().items()])
+registry.gauge("healthbot_whatsapp_outbound", "Outbound WhatsApp messages, parts, retries, failures and rate-limit waits.",
+               lambda: [({"stat": k}, v) for k, v in whatsapp_gateway.stats().items()])
+registry.gauge("healthbot_db_consultation_writes", "Consultation write transactions, rows written and largest batch.",
+               lambda: [({"stat": k}, v) for k, v in consultation_writer.stats().items()])
+registry.gauge("healthbot_profile_cache", "Returning-patient profile cache size and lookup totals.",
+               lambda: [({"stat": k}, v) for k, v in profile_cache.stats().items()])
+registry.gauge("healthbot_db_pool_checked_out", "DB connections currently checked out.",
+               lambda: [({}, get_engine().pool.checkedout())] if hasattr(get_engine().pool, "checkedout") else [])
+registry.gauge("healthbot_webhook_dedup", "MessageSid deduplication cache size, hits, misses and evictions.",
+               lambda: [({"stat": k}, v) for k, v in message_dedup.stats().items()])
+registry.gauge("healthbot_sessions_open", "In-progress sessions held by this worker's in-memory store.",
+               lambda: [({}, len(session_store))] if hasattr(session_store, "__len__") else [])
+registry.gauge("healthbot_sessions_reaped", "Abandoned sessions removed by the reaper, and failed expiry notices.",
+               lambda: [({"stat": k}, v) for k, v in session_reaper.stats().items()])
+registry.gauge("healthbot_sender_queue", "Senders with work in progress and messages waiting behind them.",
+               lambda: [({"stat": k}, v) for k, v in sender_locks.stats().items()])
+registry.gauge("healthbot_questionnaire", "Steps in the current questionnaire, hot reloads and rejected files.",
+               lambda: [({"stat": k}, v) for k, v in questionnaires.stats().items()])
+registry.gauge("healthbot_startup_seconds", "Cold-start cost by import, client construction and startup step.",
+               startup_report.samples)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    """
+    Readiness probe. The database must answer through the pool within
+    HEALTH_DB_TIMEOUT. An open LLM circuit reports "degraded" but stays ready,
+    since every worker shares the same upstream and answers are still accepted.
+    """
+    checks = {"llm_circuit": llm_scheduler.breaker.state}
+    try:
+        await asyncio.wait_for(db_manager.ping(), HEALTH_DB_TIMEOUT)
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"unavailable: {str(e) or type(e).__name__}"
+
+    if checks["database"] != "ok":
+        return JSONResponse({"status": "unavailable", "checks": checks}, status_code=503)
+    status = "degraded" if llm_scheduler.breaker.state != "closed" else "healthy"
+    return {"status": status, "checks": checks}
\ No newline at end of file
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Generic, List, Tuple, TypeVar
+
+from metrics import registry
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+batch_size = registry.histogram(
+    "healthbot_microbatch_size", "Items per dispatched micro-batch.", ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+batch_wait_seconds = registry.histogram(
+    "healthbot_microbatch_wait_seconds", "Time an item waited for its micro-batch to be dispatched.", ["batcher"],
+    buckets=(0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+)
+batch_fallbacks = registry.counter(
+    "healthbot_microbatch_fallbacks_total", "Batches whose response was unusable and were re-run item by item.",
+    ["batcher"]
+)
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects concurrent requests for up to `window` seconds or `max_items` items and
+    runs them with one `run_batch(items)` call, handing each caller its own result.
+    A lone item goes straight to `run_single`. If `run_batch` raises ValueError (an
+    unparseable response), every item is re-run through `run_single`; any other
+    error is raised to all callers in the batch.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List[T]], Awaitable[List[R]]],
+                 run_single: Callable[[T], Awaitable[R]], window: float = 0.02, max_items: int = 16):
+        self.name = name
+        self.run_batch = run_batch
+        self.run_single = run_single
+        self.window = window
+        self.max_items = max_items
+        self._pending: List[Tuple[T, asyncio.Future, float]] = []
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.monotonic()))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        now = time.monotonic()
+        for _, _, enqueued_at in batch:
+            batch_wait_seconds.observe(now - enqueued_at, batcher=self.name)
+        batch_size.observe(len(batch), batcher=self.name)
+        self.batches += 1
+        self.items += len(batch)
+        task = asyncio.create_task(self._dispatch([(item, future) for item, future, _ in batch]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: List[Tuple[T, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        try:
+            if len(items) == 1:
+                results = [await self.run_single(items[0])]
+            else:
+                try:
+                    results = await self.run_batch(items)
+                except ValueError as e:
+                    print(f"{self.name} batch of {len(items)} unusable, checking items individually: {str(e)}")
+                    self.fallbacks += 1
+                    batch_fallbacks.inc(batcher=self.name)
+                    results = await asyncio.gather(*(self.run_single(item) for item in items),
+                                                   return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "fallbacks": self.fallbacks,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
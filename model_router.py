@@ -0,0 +1,134 @@
+"""Routes each LLM call type to a model configuration, with per-route latency and cost accounting."""
+import json
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, Optional
+
+from langchain_core.messages import AIMessage
+
+from metrics import registry
+from prompts import estimate_tokens
+from startup import LazyResource
+
+# USD per million input / output tokens (prompts up to 128k tokens)
+MODEL_PRICING = {
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+route_call_seconds = registry.histogram(
+    "healthbot_llm_route_seconds", "Latency of successful LLM calls by model route.", ["route", "model"]
+)
+route_cost = registry.counter(
+    "healthbot_llm_cost_usd_total", "Estimated LLM spend from reported token usage, by model route.", ["route", "model"]
+)
+
+@dataclass(frozen=True)
+class ModelRoute:
+    name: str
+    model: str
+    temperature: float = 0.7
+    max_output_tokens: Optional[int] = None
+
+    def cost(self, usage: Optional[dict]) -> float:
+        if not usage:
+            return 0.0
+        input_price, output_price = MODEL_PRICING.get(self.model, (0.0, 0.0))
+        return (usage.get("input_tokens", 0) * input_price + usage.get("output_tokens", 0) * output_price) / 1e6
+
+class ModelRouter:
+    """
+    Picks the model configuration for a call type and holds one lazily built client
+    per route. `override` points every route at a single client (a fake in tests
+    and benchmarks) while keeping the per-route accounting.
+    """
+
+    def __init__(self, routes: Dict[str, ModelRoute], call_types: Dict[str, str], default_route: str,
+                 client_factory: Callable[[ModelRoute], object]):
+        self.routes = routes
+        self.call_types = call_types
+        self.default_route = default_route
+        self._clients = {
+            name: LazyResource(f"llm:{name}", partial(client_factory, route)) for name, route in routes.items()
+        }
+        self.totals = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "cost_usd": 0.0})
+
+    def route_for(self, call_type: Optional[str]) -> ModelRoute:
+        return self.routes[self.call_types.get(call_type, self.default_route)]
+
+    def client_for(self, route: ModelRoute):
+        return self._clients[route.name].get()
+
+    def clients(self):
+        return list(self._clients.values())
+
+    def override(self, client):
+        for resource in self._clients.values():
+            resource.override(client)
+
+    def record(self, route: ModelRoute, seconds: float, usage: Optional[dict]):
+        cost = route.cost(usage)
+        route_call_seconds.observe(seconds, route=route.name, model=route.model)
+        route_cost.inc(cost, route=route.name, model=route.model)
+        totals = self.totals[route.name]
+        totals["calls"] += 1
+        totals["seconds"] += seconds
+        totals["cost_usd"] += cost
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {**t, "avg_seconds": t["seconds"] / t["calls"] if t["calls"] else 0.0}
+            for name, t in self.totals.items()
+        }
+
+DETAILS_RE = re.compile(r"(?:Details|Answers): (\{.*\})")
+
+class OfflineLLM:
+    """
+    Deterministic, network-free stand-in for a chat model: the same prompt always
+    gets the same reply. Relevance checks pass, structured summaries are valid JSON
+    built from the answers in the prompt. Token usage is estimated from text length.
+    """
+
+    def __init__(self, route: Optional[ModelRoute] = None):
+        self.route = route
+        self.calls = 0
+
+    def reply(self, prompt: str) -> str:
+        if "#VALID#" in prompt:
+            return "#VALID#"
+        match = DETAILS_RE.search(prompt)
+        try:
+            details = json.loads(match.group(1)) if match else {}
+        except ValueError:
+            details = {}
+        if "JSON array" in prompt:
+            return json.dumps(["VALID"] * len(details))
+        symptoms = details.get("symptoms", "the reported symptoms")
+        duration = details.get("duration", "an unknown period")
+        patient_summary = (f"You reported {symptoms} for {duration}. Rest, stay hydrated and see a doctor "
+                           "if things get worse. Immediate medical attention is not needed.")
+        if "JSON object" in prompt:
+            return json.dumps({
+                "patient_summary": patient_summary,
+                "doctor_summary": f"Patient reports {symptoms} for {duration}. Symptomatic care advised.",
+                "urgency": "routine",
+            })
+        return patient_summary
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        content = self.reply(messages[-1].content)
+        if self.route is not None and self.route.max_output_tokens:
+            content = content[:self.route.max_output_tokens * 4]
+        input_tokens = sum(estimate_tokens(m.content) for m in messages)
+        output_tokens = estimate_tokens(content)
+        return AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens,
+                            "total_tokens": input_tokens + output_tokens},
+            response_metadata={"model_name": f"offline:{self.route.model if self.route else 'default'}"}
+        )
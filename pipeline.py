@@ -0,0 +1,98 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import span
+
+class PipelineFull(Exception):
+    """Raised when the completion queue is at its depth limit."""
+
+class StageFailed(Exception):
+    """Raised by a stage whose failure must not be retried, e.g. when a retry could notify the patient twice."""
+
+@dataclass
+class CompletionJob:
+    sender: str
+    session: object
+    results: Dict[str, object] = field(default_factory=dict)
+
+Stage = Callable[[CompletionJob], Awaitable[None]]
+
+class CompletionPipeline:
+    """
+    Bounded worker pool that runs end-of-consultation work (summaries, DB writes,
+    notifications) off the webhook path. Each stage is retried independently with
+    exponential backoff; a stage that still fails (or raises StageFailed) is logged
+    and the job moves on.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Stage]], workers: int = 4, max_queue: int = 100,
+                 max_attempts: int = 3, retry_backoff: float = 1.0):
+        self.stages = stages
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    def submit(self, job: CompletionJob):
+        if self.queue is None:
+            raise RuntimeError("CompletionPipeline.start() has not been called")
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise PipelineFull(f"completion queue is full ({self.max_queue} jobs)")
+
+    async def start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"completion-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self, timeout: float = 30.0):
+        """Let queued jobs finish (up to `timeout` seconds), then cancel the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Completion pipeline stopped with {self.depth()} jobs still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                for name, stage in self.stages:
+                    await self._run_stage(name, stage, job)
+            finally:
+                self.queue.task_done()
+
+    async def _run_stage(self, name: str, stage: Stage, job: CompletionJob):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with span(f"completion_{name}"):
+                    await stage(job)
+                return
+            except asyncio.CancelledError:
+                raise
+            except StageFailed as e:
+                print(f"Completion stage '{name}' failed for {job.sender}, not retrying: {str(e)}")
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    print(f"Completion stage '{name}' failed for {job.sender} after {attempt} attempts: {str(e)}")
+                    return
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import registry
+
+prefill_outcomes = registry.counter(
+    "healthbot_profile_prefill_total", "Returning-patient profile confirmations by outcome.", ["outcome"]
+)
+
+class ProfileCache:
+    """
+    Bounded LRU cache with TTL of returning-patient profiles, keyed by mobile number,
+    in front of a DB loader. Misses (new patients) are cached too. Call `invalidate`
+    after writing a patient so the next consultation sees the new values; the TTL
+    bounds staleness across workers.
+    """
+
+    def __init__(self, loader: Callable[[str], Awaitable[Optional[Dict[str, object]]]],
+                 max_entries: int = 10000, ttl: float = 3600):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # mobile_number -> (profile or None, stored_at)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, mobile_number: str) -> Optional[Dict[str, object]]:
+        entry = self._entries.get(mobile_number)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+            self._entries.move_to_end(mobile_number)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        profile = await self.loader(mobile_number)
+        self._entries[mobile_number] = (profile, time.monotonic())
+        self._entries.move_to_end(mobile_number)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, mobile_number: str):
+        if self._entries.pop(mobile_number, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations}
@@ -0,0 +1,96 @@
+"""Compact prompt construction with per-call token budgets and estimated token accounting."""
+import json
+from typing import Dict, Optional
+
+from metrics import registry
+
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARK = "…"
+
+prompt_tokens_estimated = registry.histogram(
+    "healthbot_prompt_tokens_estimated", "Estimated input tokens per LLM call, by call type.", ["call_type"],
+    buckets=(25, 50, 100, 200, 400, 800, 1600, 3200)
+)
+prompt_truncations = registry.counter(
+    "healthbot_prompt_truncations_total", "Prompts whose free-text fields were cut to fit the budget.", ["call_type"]
+)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def compact_text(text: str) -> str:
+    """Drop indentation and blank lines from a prompt template."""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - len(TRUNCATION_MARK))].rstrip() + TRUNCATION_MARK
+
+def fit_values(values: Dict[str, str], max_chars: int) -> Dict[str, str]:
+    """
+    Cut the longest values down to a common length so their total fits in
+    `max_chars`; short answers (name, age, blood group) are left untouched.
+    """
+    if sum(len(v) for v in values.values()) <= max_chars:
+        return values
+    lengths = sorted(len(v) for v in values.values())
+    remaining = max_chars
+    cap = lengths[-1]
+    for i, length in enumerate(lengths):
+        share = remaining // (len(lengths) - i)
+        if length > share:
+            cap = share
+            break
+        remaining -= length
+    return {key: truncate(value, cap) for key, value in values.items()}
+
+class PromptBuilder:
+    """
+    Renders LLM prompts with short field keys instead of full question text and
+    compact JSON, keeping each call type within its token budget by truncating
+    free-text values. Every rendered prompt is counted in the token metrics.
+    """
+
+    def __init__(self, budgets: Dict[str, int], system_prompt: str = "", default_budget: int = 1000,
+                 field_keys: Optional[Dict[str, str]] = None):
+        self.field_keys = field_keys or {}
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.system_prompt = compact_text(system_prompt)
+
+    def compact_answers(self, answers: Dict[str, str]) -> Dict[str, str]:
+        return {self.field_keys.get(question, question): answer for question, answer in answers.items()}
+
+    def render(self, call_type: str, template: str, answers: Optional[Dict[str, str]] = None,
+               **fields: str) -> str:
+        """
+        Fill `template` (placeholders: `{details}` for the answers, plus any
+        keyword fields). The fixed text and system prompt are charged to the budget
+        first; whatever is left is shared by the answer values and keyword fields.
+        """
+        template = compact_text(template)
+        details = self.compact_answers(answers or {})
+        empty = {key: "" for key in fields}
+        overhead = len(self.system_prompt) + len(template.format(
+            details=compact_json(dict.fromkeys(details, "")) if answers is not None else "", **empty
+        ))
+        available = self.budgets.get(call_type, self.default_budget) * CHARS_PER_TOKEN - overhead
+
+        values = {("details", key): str(value) for key, value in details.items()}
+        values.update({("field", key): str(value) for key, value in fields.items()})
+        fitted = fit_values(values, max(available, 0))
+        if fitted is not values:
+            prompt_truncations.inc(call_type=call_type)
+
+        prompt = template.format(
+            details=compact_json({key: fitted[("details", key)] for key in details}) if answers is not None else "",
+            **{key: fitted[("field", key)] for key in fields}
+        )
+        prompt_tokens_estimated.observe(estimate_tokens(self.system_prompt) + estimate_tokens(prompt),
+                                        call_type=call_type)
+        return prompt
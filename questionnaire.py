@@ -0,0 +1,233 @@
+"""
+Declarative consultation questionnaires.
+
+A questionnaire file (JSON) lists the steps in the order they are asked, e.g.
+
+    {"id": 2, "key": "age", "question": "...", "validator": "age", "field": "patient.age", "parse": "age"},
+    {"id": 7, "key": "medications", "question": "...", "validator": "optional_list"},
+    {"id": 11, "key": "medication_dose", "question": "...", "skip_if": [{"step": 7, "is": "negative"}]}
+
+`compile_questionnaire` turns that into an indexed state machine: rules, parsers
+and skip conditions are resolved once, answers are keyed by the step's integer
+id, and `field` maps an answer onto a Patient or Consultation column. Ids must
+stay stable across edits of the file, because sessions in progress store them.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from db import Consultation, Patient
+from validators import PARSERS, PREDICATES, RULES, Rule
+
+# Columns a step may fill, by table; ids, timestamps and the generated summaries are not answers
+MAPPABLE_COLUMNS = {
+    "patient": {"name", "age", "blood_group", "allergies", "email"},
+    "consultation": {"symptoms", "symptoms_duration"},
+}
+# ConsultationRecord values used when no step supplies them
+RECORD_DEFAULTS = {"name": "Unknown", "age": None, "symptoms": "", "symptoms_duration": ""}
+
+class QuestionnaireError(ValueError):
+    pass
+
+@dataclass(frozen=True)
+class Step:
+    id: int
+    key: str
+    question: str
+    rule: Rule
+    parse: Callable[[str], object]
+    # (table, column) this answer is stored in, if any
+    field: Optional[Tuple[str, str]] = None
+    # (step id, predicate) pairs; the step is skipped when any earlier answer matches
+    skip_if: Tuple[Tuple[int, Callable[[str], bool]], ...] = ()
+
+    def skipped(self, answers: Dict[int, str]) -> bool:
+        return any(step_id in answers and predicate(answers[step_id]) for step_id, predicate in self.skip_if)
+
+class Questionnaire:
+    def __init__(self, name: str, version: str, welcome: str, steps: Tuple[Step, ...]):
+        self.name = name
+        self.version = version
+        self.welcome = welcome
+        self.steps = steps
+        self.by_id = {step.id: step for step in steps}
+        self.position = {step.id: i for i, step in enumerate(steps)}
+        # Patient column -> step, for returning patients' stored answers
+        self.profile_steps = {step.field[1]: step for step in steps if step.field and step.field[0] == "patient"}
+
+    def next_step(self, from_id: Optional[int], answers: Dict[int, str]) -> Optional[Step]:
+        """The first step at or after `from_id` that is neither answered nor skipped; None when finished."""
+        start = self.position.get(from_id, 0)
+        for step in self.steps[start:]:
+            if step.id not in answers and not step.skipped(answers):
+                return step
+        return None
+
+    def keyed(self, answers: Dict[int, str]) -> Dict[str, str]:
+        """Answers under their short keys, in questionnaire order (the form used in LLM prompts)."""
+        return {step.key: answers[step.id] for step in self.steps if step.id in answers}
+
+    def labelled(self, answers: Dict[int, str]) -> Dict[str, str]:
+        """Answers under their full question text, in questionnaire order."""
+        return {step.question: answers[step.id] for step in self.steps if step.id in answers}
+
+    def record_fields(self, answers: Dict[int, str]) -> dict:
+        """ConsultationRecord keyword arguments from the mapped steps."""
+        fields = dict(RECORD_DEFAULTS)
+        for step in self.steps:
+            if step.field and step.id in answers:
+                fields[step.field[1]] = step.parse(answers[step.id])
+        return fields
+
+def _column(spec: str, step_id: int) -> Tuple[str, str]:
+    table, _, column = spec.partition(".")
+    model = {"patient": Patient, "consultation": Consultation}.get(table)
+    if model is None or column not in model.__table__.columns or column not in MAPPABLE_COLUMNS[table]:
+        raise QuestionnaireError(f"step {step_id}: cannot map an answer onto {spec!r}")
+    return table, column
+
+def compile_questionnaire(spec: dict, version: str = "") -> Questionnaire:
+    """Validate a parsed questionnaire file and build its state machine; raises QuestionnaireError."""
+    raw_steps = spec.get("steps")
+    if not raw_steps:
+        raise QuestionnaireError("questionnaire has no steps")
+
+    steps = []
+    seen_ids = {}
+    seen_fields = set()
+    for raw in raw_steps:
+        step_id = raw.get("id")
+        if not isinstance(step_id, int) or isinstance(step_id, bool):
+            raise QuestionnaireError(f"step {raw.get('key')!r}: id must be an integer")
+        if step_id in seen_ids:
+            raise QuestionnaireError(f"duplicate step id {step_id}")
+        if not raw.get("key") or not raw.get("question"):
+            raise QuestionnaireError(f"step {step_id}: key and question are required")
+        rule = RULES.get(raw.get("validator", "none"))
+        if rule is None:
+            raise QuestionnaireError(f"step {step_id}: unknown validator {raw.get('validator')!r}")
+        parse = PARSERS.get(raw.get("parse", "text"))
+        if parse is None:
+            raise QuestionnaireError(f"step {step_id}: unknown parser {raw.get('parse')!r}")
+
+        field = _column(raw["field"], step_id) if raw.get("field") else None
+        if field in seen_fields:
+            raise QuestionnaireError(f"step {step_id}: {'.'.join(field)} is already filled by another step")
+        if field:
+            seen_fields.add(field)
+
+        skip_if = []
+        for condition in raw.get("skip_if", []):
+            # Only earlier steps are answered by the time this one is reached
+            if condition.get("step") not in seen_ids:
+                raise QuestionnaireError(f"step {step_id}: skip_if must refer to an earlier step id")
+            predicate = PREDICATES.get(condition.get("is"))
+            if predicate is None:
+                raise QuestionnaireError(f"step {step_id}: unknown skip_if predicate {condition.get('is')!r}")
+            skip_if.append((condition["step"], predicate))
+        if skip_if and not steps:
+            raise QuestionnaireError("the first step cannot be conditional")
+
+        seen_ids[step_id] = raw["key"]
+        steps.append(Step(id=step_id, key=raw["key"], question=raw["question"], rule=rule, parse=parse,
+                          field=field, skip_if=tuple(skip_if)))
+
+    if len(set(seen_ids.values())) != len(seen_ids):
+        raise QuestionnaireError("step keys must be unique")
+    return Questionnaire(spec.get("name", "questionnaire"), version, spec.get("welcome", ""), tuple(steps))
+
+def load_questionnaire(path: str) -> Questionnaire:
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        spec = json.loads(raw)
+    except ValueError as e:
+        raise QuestionnaireError(f"{path} is not valid JSON: {str(e)}")
+    return compile_questionnaire(spec, version=hashlib.sha256(raw).hexdigest()[:12])
+
+class QuestionnaireLoader:
+    """
+    Holds the current compiled questionnaire and swaps in a new one when the file
+    changes. A file that fails to compile is reported and ignored, so a bad edit
+    never reaches patients. Recent versions are retained so conversations started
+    on one finish on it; `get` falls back to the current version for any other.
+    """
+
+    def __init__(self, path: str, interval: float = 5.0, retain: int = 8):
+        self.path = path
+        self.interval = interval
+        self.retain = retain
+        self.current = load_questionnaire(path)
+        self._versions = OrderedDict([(self.current.version, self.current)])
+        self._stat = self._file_stat()
+        self._task = None
+        self.reloads = 0
+        self.failures = 0
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def get(self, version: Optional[str]) -> Questionnaire:
+        return self._versions.get(version, self.current)
+
+    def _load_if_changed(self) -> Optional[Questionnaire]:
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return None
+        self._stat = stat
+        try:
+            return load_questionnaire(self.path)
+        except (OSError, QuestionnaireError) as e:
+            self.failures += 1
+            print(f"Questionnaire reload failed, keeping version {self.current.version}: {str(e)}")
+            return None
+
+    def reload(self) -> bool:
+        """Recompile if the file changed; True when a new version was swapped in."""
+        return self._swap(self._load_if_changed())
+
+    def _swap(self, questionnaire: Optional[Questionnaire]) -> bool:
+        if questionnaire is None or questionnaire.version == self.current.version:
+            return False
+        self._versions[questionnaire.version] = questionnaire
+        while len(self._versions) > self.retain:
+            self._versions.popitem(last=False)
+        # One reference swap: new conversations see the whole new questionnaire or none of it
+        self.current = questionnaire
+        self.reloads += 1
+        print(f"Questionnaire {questionnaire.name} reloaded: version {questionnaire.version}, "
+              f"{len(questionnaire.steps)} steps")
+        return True
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="questionnaire-reload")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Read and compile off the event loop; the swap itself happens on it
+                self._swap(await asyncio.to_thread(self._load_if_changed))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Questionnaire reload error: {str(e)}")
+
+    def stats(self) -> dict:
+        return {"steps": len(self.current.steps), "reloads": self.reloads, "failures": self.failures}
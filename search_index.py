@@ -0,0 +1,137 @@
+"""
+Full-text search over consultation symptoms and summaries.
+
+SQLite uses an FTS5 table that points at `consultations` (external content, so
+the text is not stored twice) and is written alongside each new consultation.
+MySQL uses an InnoDB FULLTEXT index, which the server maintains on every insert.
+Both return hits ranked best first with a score that is higher for better matches.
+Scoring every match of a very common word is what makes ranked search slow on a
+large table, so callers can cap ranking to the newest `rank_window` matches.
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, inspect, text
+
+# Columns searched, in the order the FTS5 table declares them
+SEARCH_COLUMNS = ("symptoms", "patient_summary", "doctor_summary")
+
+# A quoted phrase or a single word
+TERM_RE = re.compile(r'"([^"]*)"|([^\s"]+)')
+
+def parse_terms(query: str) -> List[str]:
+    """Split a search box query into words and "quoted phrases"; every term must match."""
+    terms = []
+    for phrase, word in TERM_RE.findall(query):
+        term = " ".join((phrase or word).split())
+        if term:
+            terms.append(term)
+    return terms
+
+def _quoted(term: str) -> str:
+    # Quoting makes punctuation and operator characters literal in both FTS5 and MySQL boolean mode
+    return '"' + term.replace('"', " ") + '"'
+
+def _page(inner: str):
+    """Join one already ranked and limited page of (id, score) hits to its consultation and patient."""
+    return text(f"""
+        SELECT c.id AS consultation_id, c.consultation_date, p.id AS patient_id, p.name, p.mobile_number,
+               c.symptoms, c.symptoms_duration, c.patient_summary, c.doctor_summary, m.score
+        FROM ({inner}) m
+        JOIN consultations c ON c.id = m.id
+        JOIN patients p ON p.id = c.patient_id
+        ORDER BY m.score DESC, c.id DESC
+    """).columns(consultation_date=DateTime)  # SQLite hands raw SQL dates back as strings
+
+class SQLiteFTS5Index:
+    dialect = "sqlite"
+    table = "consultations_fts"
+
+    # bm25 column weights: a symptom match outranks one that only appears in a summary
+    weights = (3.0, 1.0, 1.0)
+
+    def create(self, engine):
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": self.table}
+            ).first()
+            if exists:
+                return
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+                f"{', '.join(SEARCH_COLUMNS)}, content='consultations', content_rowid='id', "
+                "tokenize='porter unicode61')"
+            ))
+            # Index consultations written before search existed
+            conn.execute(text(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')"))
+
+    def index(self, db, rows: Sequence[dict]):
+        """Add new consultations (dicts with `id` and the searched columns) in the caller's transaction."""
+        if rows:
+            db.execute(
+                text(f"INSERT INTO {self.table}(rowid, {', '.join(SEARCH_COLUMNS)}) "
+                     f"VALUES (:id, {', '.join(':' + c for c in SEARCH_COLUMNS)})"),
+                [{"id": row["id"], **{c: row.get(c) or "" for c in SEARCH_COLUMNS}} for row in rows]
+            )
+
+    def search(self, db, terms: List[str], limit: int, after: Optional[Tuple[float, int]] = None,
+               patient_id: Optional[int] = None, rank_window: int = 0) -> list:
+        params = {"match": " ".join(_quoted(t) for t in terms), "limit": limit}
+        score = f"-bm25({self.table}, {', '.join(str(w) for w in self.weights)})"
+        where = [f"{self.table} MATCH :match"]
+        if patient_id is not None:
+            params["patient_id"] = patient_id
+            where.append("rowid IN (SELECT id FROM consultations WHERE patient_id = :patient_id)")
+        elif rank_window:
+            # Only the newest `rank_window` matches are scored; reading rowids is cheap, bm25 is not.
+            # The cutoff is the rank_window-th newest match, which is itself included
+            params["rank_offset"] = rank_window - 1
+            where.append(f"rowid >= coalesce((SELECT rowid FROM {self.table} WHERE {self.table} MATCH :match "
+                         "ORDER BY rowid DESC LIMIT 1 OFFSET :rank_offset), 0)")
+        if after is not None:
+            params["after_score"], params["after_id"] = after
+            where.append(f"({score} < :after_score OR ({score} = :after_score AND rowid < :after_id))")
+        return db.execute(_page(
+            f"SELECT rowid AS id, {score} AS score FROM {self.table} WHERE {' AND '.join(where)} "
+            "ORDER BY score DESC, rowid DESC LIMIT :limit"
+        ), params).all()
+
+class MySQLFullTextIndex:
+    dialect = "mysql"
+    name = "ft_consultations_text"
+
+    def create(self, engine):
+        if any(ix["name"] == self.name for ix in inspect(engine).get_indexes("consultations")):
+            return
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE consultations ADD FULLTEXT INDEX {self.name} ({', '.join(SEARCH_COLUMNS)})"))
+
+    def index(self, db, rows: Sequence[dict]):
+        # InnoDB updates FULLTEXT indexes itself when the consultation row is inserted
+        pass
+
+    def search(self, db, terms: List[str], limit: int, after: Optional[Tuple[float, int]] = None,
+               patient_id: Optional[int] = None, rank_window: int = 0) -> list:
+        params = {"match": " ".join("+" + _quoted(t) for t in terms), "limit": limit}
+        score = f"MATCH({', '.join(SEARCH_COLUMNS)}) AGAINST (:match IN BOOLEAN MODE)"
+        where = [score]
+        if patient_id is not None:
+            params["patient_id"] = patient_id
+            where.append("patient_id = :patient_id")
+        elif rank_window:
+            params["rank_offset"] = rank_window - 1
+            where.append(f"id >= coalesce((SELECT id FROM consultations WHERE {score} "
+                         "ORDER BY id DESC LIMIT 1 OFFSET :rank_offset), 0)")
+        if after is not None:
+            params["after_score"], params["after_id"] = after
+            where.append(f"({score} < :after_score OR ({score} = :after_score AND id < :after_id))")
+        return db.execute(_page(
+            f"SELECT id, {score} AS score FROM consultations WHERE {' AND '.join(where)} "
+            "ORDER BY score DESC, id DESC LIMIT :limit"
+        ), params).all()
+
+_INDEXES = {index.dialect: index for index in (SQLiteFTS5Index(), MySQLFullTextIndex())}
+
+def search_index_for(dialect: str):
+    """The full-text backend for a SQLAlchemy dialect name, or None if search isn't supported on it."""
+    return _INDEXES.get(dialect)
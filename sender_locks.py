@@ -0,0 +1,59 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from metrics import registry
+
+sender_lock_wait_seconds = registry.histogram(
+    "healthbot_sender_lock_wait_seconds", "Time a message waited for earlier messages from the same sender."
+)
+
+class _Slot:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+class KeyedLock:
+    """
+    One FIFO lock per key (sender number). Work for the same sender runs strictly
+    in arrival order while different senders stay fully concurrent. A key's lock is
+    dropped as soon as nobody holds or waits on it, so idle senders cost no memory.
+    """
+
+    def __init__(self):
+        self._slots: Dict[str, _Slot] = {}
+        self.max_waiting = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key: str) -> bool:
+        """True while a message from `key` is being handled or queued."""
+        return key in self._slots
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+        slot.refs += 1
+        self.max_waiting = max(self.max_waiting, slot.refs - 1)
+        started = time.perf_counter()
+        try:
+            async with slot.lock:
+                sender_lock_wait_seconds.observe(time.perf_counter() - started)
+                yield
+        finally:
+            slot.refs -= 1
+            if slot.refs == 0:
+                del self._slots[key]
+
+    def waiting(self) -> int:
+        """Messages queued behind another message from the same sender."""
+        return sum(slot.refs - 1 for slot in self._slots.values() if slot.refs > 1)
+
+    def stats(self) -> Dict[str, int]:
+        return {"active_senders": len(self._slots), "waiting": self.waiting(), "max_waiting": self.max_waiting}
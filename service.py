@@ -1,20 +1,28 @@
 import uvicorn
 from pyngrok import ngrok
 from config import *
+from contextlib import asynccontextmanager
+import argparse
+import asyncio
+import importlib.util
+import os
+import shutil
+import subprocess
 import sys
+import tempfile
 
 
-def setup_ngrok():
+def setup_ngrok(port=5001):
    try:
        ngrok.set_auth_token(NGROK_TOKEN)
-       
+
        # Clean existing tunnels silently
        for tunnel in ngrok.get_tunnels():
            ngrok.disconnect(tunnel.public_url)
 
        http_tunnel = ngrok.connect(
-           5001,
-           subdomain="refined-magnetic-buck", 
+           port,
+           subdomain="refined-magnetic-buck",
            bind_tls=True
        )
        print(f"\nNgrok URL: {http_tunnel.public_url}\n")
@@ -25,12 +33,116 @@ def setup_ngrok():
 
 def start_service():
     public_url = setup_ngrok()
-       
+
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=5001,
     )
 
+# Faster event loop and HTTP parser when installed; uvicorn's defaults otherwise
+LOOP = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+HTTP = "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+class WorkerPool:
+    """uvicorn processes serving main:app, each on its own unix socket; workers that exit are restarted."""
+
+    def __init__(self, workers, socket_dir, limit_concurrency, temporary_dir=False):
+        self.temporary_dir = socket_dir if temporary_dir else None
+        self.sockets = [os.path.join(socket_dir, f"worker-{i}.sock") for i in range(workers)]
+        self.limit_concurrency = limit_concurrency
+        self.processes = [None] * workers
+        self.restarts = 0
+
+    def spawn(self, index):
+        if os.path.exists(self.sockets[index]):
+            os.unlink(self.sockets[index])
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app",
+             "--uds", self.sockets[index],
+             "--loop", LOOP,
+             "--http", HTTP,
+             # Past this many open requests the worker answers 503 itself
+             "--limit-concurrency", str(self.limit_concurrency),
+             "--no-access-log"],
+            # Tables are created once by the launcher, not raced by every worker
+            env={**os.environ, "DB_CREATE_TABLES": "0"}
+        )
+
+    def start(self):
+        for index in range(len(self.processes)):
+            self.spawn(index)
+
+    async def supervise(self):
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if process.poll() is not None:
+                    print(f"Worker {index} exited with code {process.returncode}; restarting")
+                    self.restarts += 1
+                    self.spawn(index)
+
+    def stop(self, timeout=30):
+        for process in self.processes:
+            if process and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process:
+                try:
+                    process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        for path in self.sockets:
+            if os.path.exists(path):
+                os.unlink(path)
+        if self.temporary_dir:
+            shutil.rmtree(self.temporary_dir, ignore_errors=True)
+
+def start_production(workers=SERVICE_WORKERS, port=SERVICE_PORT, use_ngrok=False):
+    """
+    Run `workers` app processes behind the sender-affinity dispatcher on `port`.
+    Every message from one WhatsApp number reaches the same worker, so the
+    in-memory session store stays correct with any number of workers.
+    """
+    from dispatcher import Dispatcher
+    from db import init_db
+
+    if DB_CREATE_TABLES:
+        init_db()
+
+    socket_dir = WORKER_SOCKET_DIR or tempfile.mkdtemp(prefix="healthbot-")
+    pool = WorkerPool(workers, socket_dir, WORKER_LIMIT_CONCURRENCY, temporary_dir=not WORKER_SOCKET_DIR)
+    dispatcher = Dispatcher(pool.sockets, max_in_flight=WORKER_MAX_IN_FLIGHT)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        supervisor = asyncio.create_task(pool.supervise())
+        yield
+        supervisor.cancel()
+        await dispatcher.close()
+        # uvicorn re-raises SIGTERM/SIGINT once it has shut down, so the workers are
+        # stopped here; code after uvicorn.run() never runs on a signal
+        await asyncio.to_thread(pool.stop)
+
+    print(f"Starting {workers} workers (loop={LOOP}, http={HTTP}) behind the dispatcher on port {port}")
+    pool.start()
+    if use_ngrok:
+        setup_ngrok(port)
+    try:
+        uvicorn.run(dispatcher.build_app(lifespan), host="0.0.0.0", port=port, loop=LOOP, http=HTTP,
+                    access_log=False)
+    finally:
+        pool.stop()
+
 if __name__ == "__main__":
-   start_service()
\ No newline at end of file
+   parser = argparse.ArgumentParser(description="Run the WhatsApp consultation service")
+   parser.add_argument("--production", action="store_true", help="multiple workers behind the dispatcher")
+   parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+   parser.add_argument("--port", type=int, default=SERVICE_PORT)
+   parser.add_argument("--ngrok", action="store_true", help="also open the ngrok tunnel in production mode")
+   args = parser.parse_args()
+
+   if args.production:
+       start_production(args.workers, args.port, args.ngrok)
+   else:
+       start_service()
@@ -0,0 +1,203 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+
+class SessionStore:
+    """
+    Storage for in-progress ChatSessions keyed by sender number.
+    Callers must `save` a session after mutating it; shared backends hold a copy.
+    """
+
+    async def get(self, sender: str):
+        raise NotImplementedError
+
+    async def save(self, sender: str, session):
+        raise NotImplementedError
+
+    async def delete(self, sender: str):
+        raise NotImplementedError
+
+    async def expire_idle(self, idle_seconds: float) -> List[str]:
+        """Remove sessions not saved for `idle_seconds` and return their senders."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class MemorySessionStore(SessionStore):
+    """In-process store with LRU eviction and an idle TTL. Only valid for a single worker."""
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 86400):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # sender -> (session, last_seen)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def get(self, sender: str):
+        entry = self._sessions.get(sender)
+        if entry is None:
+            return None
+        session, last_seen = entry
+        if time.monotonic() - last_seen > self.ttl:
+            del self._sessions[sender]
+            return None
+        self._sessions.move_to_end(sender)
+        return session
+
+    async def save(self, sender: str, session):
+        self._sessions[sender] = (session, time.monotonic())
+        self._sessions.move_to_end(sender)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, sender: str):
+        self._sessions.pop(sender, None)
+
+    async def expire_idle(self, idle_seconds: float) -> List[str]:
+        cutoff = time.monotonic() - idle_seconds
+        expired = [sender for sender, (_, last_seen) in self._sessions.items() if last_seen <= cutoff]
+        for sender in expired:
+            del self._sessions[sender]
+        return expired
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Shared store for multiple worker processes on one host. Uses SQLite in WAL mode
+    so readers never block the writer; sessions are stored as serialized blobs.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, path: str, loads: Callable[[bytes], object], ttl: float = 86400):
+        self.path = path
+        self.loads = loads
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            "sender TEXT PRIMARY KEY, state BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _get(self, sender: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM chat_sessions WHERE sender = ? AND updated_at > ?",
+                (sender, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _save(self, sender: str, state: bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO chat_sessions (sender, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(sender) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (sender, state, time.time())
+            )
+            self._saves += 1
+            if self._saves % self.PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM chat_sessions WHERE updated_at <= ?", (time.time() - self.ttl,))
+
+    def _delete(self, sender: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM chat_sessions WHERE sender = ?", (sender,))
+
+    def _expire_idle(self, idle_seconds: float) -> List[str]:
+        # One atomic DELETE ... RETURNING, so with several workers each sender is reported once
+        with self._lock:
+            rows = self._conn.execute(
+                "DELETE FROM chat_sessions WHERE updated_at <= ? RETURNING sender", (time.time() - idle_seconds,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    async def get(self, sender: str):
+        state = await asyncio.to_thread(self._get, sender)
+        if state is None:
+            return None
+        try:
+            return self.loads(state)
+        except ValueError:
+            # State written by an incompatible version; start the sender over
+            return None
+
+    async def save(self, sender: str, session):
+        await asyncio.to_thread(self._save, sender, session.dumps())
+
+    async def delete(self, sender: str):
+        await asyncio.to_thread(self._delete, sender)
+
+    async def expire_idle(self, idle_seconds: float) -> List[str]:
+        return await asyncio.to_thread(self._expire_idle, idle_seconds)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SessionReaper:
+    """
+    Background task that drops abandoned conversations: every `interval` seconds,
+    sessions idle for longer than `idle_ttl` are removed from the store and, if
+    `on_expired` is given, it is awaited for each sender (e.g. to send an expiry
+    notice). Failures in `on_expired` are logged and do not stop the sweep.
+    """
+
+    def __init__(self, store: SessionStore, idle_ttl: float, interval: float = 60.0,
+                 on_expired: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.store = store
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self.on_expired = on_expired
+        self._task = None
+        self.reaped = 0
+        self.notify_failures = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="session-reaper")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Session reaper error: {str(e)}")
+
+    async def reap_once(self) -> int:
+        expired = await self.store.expire_idle(self.idle_ttl)
+        self.reaped += len(expired)
+        if self.on_expired is not None:
+            for sender in expired:
+                try:
+                    await self.on_expired(sender)
+                except Exception as e:
+                    self.notify_failures += 1
+                    print(f"Session expiry notice to {sender} failed: {str(e)}")
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {"reaped": self.reaped, "notify_failures": self.notify_failures}
+
+def build_session_store(backend: str, loads: Callable[[bytes], object], path: str,
+                        ttl: float, max_sessions: int) -> SessionStore:
+    if backend == "memory":
+        return MemorySessionStore(max_sessions=max_sessions, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, loads=loads, ttl=ttl)
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
@@ -0,0 +1,64 @@
+"""Lazy client construction and a cold-start cost report for worker boot tuning."""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class StartupReport:
+    """Records how long each import, client construction and startup step took."""
+
+    def __init__(self):
+        self.entries: List[Tuple[str, str, float]] = []
+
+    @contextmanager
+    def measure(self, phase: str, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.entries.append((phase, name, time.perf_counter() - started))
+
+    def samples(self):
+        # One series per (phase, name): a step measured more than once (e.g. an import made
+        # by each LLM route's client factory) reports its total
+        totals = {}
+        for phase, name, seconds in self.entries:
+            totals[(phase, name)] = totals.get((phase, name), 0.0) + seconds
+        return [({"phase": phase, "name": name}, round(seconds, 6)) for (phase, name), seconds in totals.items()]
+
+    def log(self):
+        total = sum(seconds for _, _, seconds in self.entries)
+        print(f"\nStartup cost ({total * 1000:.1f} ms measured):")
+        for phase, name, seconds in sorted(self.entries, key=lambda entry: -entry[2]):
+            print(f"  {phase:<8} {name:<32} {seconds * 1000:9.1f} ms")
+
+startup_report = StartupReport()
+
+class LazyResource(Generic[T]):
+    """
+    Builds a client on first use instead of at import time. Construction time is
+    recorded in the startup report; `override` swaps in a fake for tests and benchmarks.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._value is not None
+
+    def get(self) -> T:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    with startup_report.measure("client", self.name):
+                        self._value = self.factory()
+        return self._value
+
+    def override(self, value: T):
+        self._value = value
@@ -0,0 +1,100 @@
+import json
+import re
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+URGENCY_IMMEDIATE = "immediate"
+URGENCY_SOON = "soon"
+URGENCY_ROUTINE = "routine"
+URGENCY_LEVELS = (URGENCY_IMMEDIATE, URGENCY_SOON, URGENCY_ROUTINE)
+# The model gave no usable level; never treated as urgent
+URGENCY_UNKNOWN = "unknown"
+
+STRUCTURED_SUMMARY_PROMPT = """
+Based on this consultation, respond with a single JSON object and nothing else:
+{{
+  "patient_summary": "for the patient: 1. brief summary of condition 2. basic recommendations 3. whether immediate medical attention is needed. Simple and clear.",
+  "doctor_summary": "for the clinician: 1. patient condition overview 2. key symptoms and duration 3. relevant medical history 4. recommendations",
+  "urgency": "immediate" | "soon" | "routine"
+}}
+
+Details: {details}
+"""
+
+FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+# The last line the two-call patient summary is asked to end with, e.g. "Urgency: soon"
+URGENCY_LINE_RE = re.compile(r"(?:^|\n)[ \t*_]*urgency[ \t*_]*:[ \t*_]*(?P<urgency>[a-z]+)[ \t*_.]*\s*$", re.IGNORECASE)
+
+def split_urgency(text: str) -> Tuple[str, str]:
+    """
+    Separate the trailing "Urgency: ..." line from a two-call patient summary.
+    Without a recognised level the urgency is unknown; the prose is never guessed from.
+
+    >>> split_urgency("Rest and drink fluids.\\nUrgency: routine")
+    ('Rest and drink fluids.', 'routine')
+    >>> split_urgency("Rest and drink fluids.\\n**Urgency:** Immediate")
+    ('Rest and drink fluids.', 'immediate')
+    >>> split_urgency("**3. Immediate Medical Attention:** No.")
+    ('**3. Immediate Medical Attention:** No.', 'unknown')
+    """
+    match = URGENCY_LINE_RE.search(text)
+    if match is None:
+        return text.strip(), URGENCY_UNKNOWN
+    urgency = match.group("urgency").lower()
+    return text[:match.start()].strip(), urgency if urgency in URGENCY_LEVELS else URGENCY_UNKNOWN
+
+def parse_structured_summary(text: str) -> Dict[str, str]:
+    """Parse the single-call JSON response; raises ValueError when it is unusable."""
+    data = json.loads(FENCE_RE.sub("", text.strip()))
+    if not isinstance(data, dict):
+        raise ValueError("structured summary is not a JSON object")
+
+    patient_summary = data.get("patient_summary")
+    doctor_summary = data.get("doctor_summary")
+    if not isinstance(patient_summary, str) or not patient_summary.strip():
+        raise ValueError("structured summary is missing patient_summary")
+    if not isinstance(doctor_summary, str) or not doctor_summary.strip():
+        raise ValueError("structured summary is missing doctor_summary")
+
+    urgency = str(data.get("urgency", "")).strip().lower()
+    if urgency not in URGENCY_LEVELS:
+        urgency = URGENCY_UNKNOWN
+
+    return {
+        "patient_summary": patient_summary.strip(),
+        "doctor_summary": doctor_summary.strip(),
+        "urgency": urgency,
+    }
+
+class SummaryStats:
+    """Latency and token usage per summary mode, so single- and two-call generation can be compared."""
+
+    def __init__(self):
+        self.modes = defaultdict(lambda: {
+            "runs": 0, "seconds": 0.0, "llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "fallbacks": 0
+        })
+
+    def record_call(self, mode: str, usage: Optional[dict]):
+        stats = self.modes[mode]
+        stats["llm_calls"] += 1
+        if usage:
+            stats["input_tokens"] += usage.get("input_tokens", 0)
+            stats["output_tokens"] += usage.get("output_tokens", 0)
+
+    def record_run(self, mode: str, seconds: float):
+        stats = self.modes[mode]
+        stats["runs"] += 1
+        stats["seconds"] += seconds
+
+    def record_fallback(self, mode: str):
+        self.modes[mode]["fallbacks"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            mode: {
+                **stats,
+                "avg_seconds": stats["seconds"] / stats["runs"] if stats["runs"] else 0.0,
+                "avg_tokens": (stats["input_tokens"] + stats["output_tokens"]) / stats["runs"] if stats["runs"] else 0.0,
+            }
+            for mode, stats in self.modes.items()
+        }
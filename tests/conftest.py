@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh SQLite database behind db.db_manager; yields the db module."""
+    import db
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(db, "_engine", None)
+    db.init_db()
+    yield db
+    db.get_engine().dispose()
+
+def save_consultations(db, records):
+    with db.db_manager.get_db() as session:
+        return db.db_manager._save_consultations(session, records)
+
+def record(db, mobile_number: str, symptoms: str = "cough", **fields):
+    values = {"name": "Test Patient", "age": 30, "symptoms_duration": "2 days",
+              "patient_summary": "Rest and drink fluids.", "doctor_summary": "Likely viral.", **fields}
+    return db.ConsultationRecord(mobile_number=mobile_number, symptoms=symptoms, **values)
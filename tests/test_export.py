@@ -0,0 +1,37 @@
+from conftest import record, save_consultations
+
+def test_chunks_are_keyset_pages_in_id_order(database):
+    saved = save_consultations(database, [record(database, f"+1555000000{i}") for i in range(7)])
+    ids = [s.consultation_id for s in saved]
+
+    chunks = [[row.consultation_id for row in rows]
+              for rows in database.db_manager.iter_consultation_rows(chunk_size=3)]
+
+    assert chunks == [ids[0:3], ids[3:6], ids[6:7]]
+
+def test_exact_multiple_has_no_empty_trailing_chunk(database):
+    save_consultations(database, [record(database, f"+1555000000{i}") for i in range(6)])
+
+    sizes = [len(rows) for rows in database.db_manager.iter_consultation_rows(chunk_size=3)]
+
+    assert sizes == [3, 3]
+
+def test_filtered_pages_continue_after_the_last_matching_id(database):
+    # Alternate two patients so the matching ids are not contiguous
+    saved = save_consultations(database, [record(database, "+15550000001" if i % 2 else "+15550000002")
+                                          for i in range(9)])
+    patient_id = saved[1].patient_id
+    expected = [s.consultation_id for s in saved if s.patient_id == patient_id]
+
+    chunks = [[row.consultation_id for row in rows]
+              for rows in database.db_manager.iter_consultation_rows(patient_id=patient_id, chunk_size=2)]
+
+    assert chunks == [expected[0:2], expected[2:4]]
+
+def test_no_connection_is_held_between_chunks(database):
+    save_consultations(database, [record(database, f"+1555000000{i}") for i in range(4)])
+    rows_iter = database.db_manager.iter_consultation_rows(chunk_size=2)
+
+    next(rows_iter)
+
+    assert database.get_engine().pool.checkedout() == 0
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from conftest import record, save_consultations
+
+def counters(db, day):
+    with db.db_manager.get_db() as session:
+        rows = db.db_manager._daily_rollups(session, day, day, ("age_band", "blood_group", "urgency"))
+    return {(row.dimension, row.value): row.count for row in rows}
+
+def test_backfill_counts_the_profile_stored_with_each_consultation(database):
+    from backfill_rollups import backfill
+
+    save_consultations(database, [record(database, "+15550000001", age=17, blood_group="A+", urgency="soon")])
+    # The same patient later updates their profile
+    saved = save_consultations(database, [record(database, "+15550000001", age=45, blood_group="o negative",
+                                                 urgency="routine")])
+    with database.db_manager.get_db() as session:
+        day = session.get(database.Consultation, saved[0].consultation_id).consultation_date.date()
+    live = counters(database, day)
+
+    backfill(day + timedelta(days=1), chunk_size=1)
+
+    assert counters(database, day) == live
+    assert live[("age_band", "0-17")] == 1
+    assert live[("blood_group", "A+")] == 1
+    assert live[("urgency", "soon")] == 1
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from conftest import record, save_consultations
+
+def search_ids(db, rank_window):
+    with db.db_manager.get_db() as session:
+        rows = db.db_manager._search_consultations(session, ["cough"], limit=50, rank_window=rank_window)
+    return sorted(row.consultation_id for row in rows)
+
+def test_rank_window_scores_exactly_the_newest_matches(database):
+    saved = save_consultations(database, [record(database, f"+1555000000{i}") for i in range(5)])
+    ids = [s.consultation_id for s in saved]
+
+    assert search_ids(database, 1) == ids[-1:]
+    assert search_ids(database, 3) == ids[-3:]
+    assert search_ids(database, 5) == ids
+    assert search_ids(database, 6) == ids
+
+def test_rank_window_counts_only_matches(database):
+    saved = save_consultations(database, [
+        record(database, "+15550000001", symptoms="cough"),
+        record(database, "+15550000002", symptoms="headache"),
+        record(database, "+15550000003", symptoms="dry cough"),
+        record(database, "+15550000004", symptoms="rash"),
+    ])
+
+    assert search_ids(database, 2) == [saved[0].consultation_id, saved[2].consultation_id]
+
+def test_search_returns_iso_dates(database, monkeypatch):
+    import history
+    from auth import require_api_key
+
+    monkeypatch.setattr(history, "db_manager", database.db_manager)
+    app = FastAPI()
+    app.include_router(history.router)
+    app.dependency_overrides[require_api_key] = lambda: None
+    save_consultations(database, [record(database, "+15550000001")])
+
+    results = TestClient(app).get("/search", params={"q": "cough"}).json()["results"]
+
+    assert len(results) == 1
+    assert "T" in results[0]["consultation_date"]
+    datetime.fromisoformat(results[0]["consultation_date"])
@@ -0,0 +1,163 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+VALID = "valid"
+INVALID = "invalid"
+AMBIGUOUS = "ambiguous"
+
+@dataclass(frozen=True)
+class RuleResult:
+    verdict: str
+    message: str = ""
+
+Rule = Callable[[str], RuleResult]
+
+VALID_RESULT = RuleResult(VALID)
+AMBIGUOUS_RESULT = RuleResult(AMBIGUOUS)
+
+NEGATIVE_RE = re.compile(
+    r"^(no|nope|none|nil|nothing|n/?a|not really|never|no[, ]+(i (do not|don't)|none|nothing)"
+    r"|(i )?(do not|don't)( have( any)?)?( known)?( allergies| medications| conditions)?"
+    r"|not that i know( of)?)[\s.!]*$",
+    re.IGNORECASE
+)
+# "My name is Priya Shah" -> "Priya Shah"; used to store the name, never to accept the answer
+# ("I'm diabetic" and "it's urgent" match too)
+NAME_RE = re.compile(
+    r"^(my name is|my name's|name is|i am|i'm|im|it's|it is|this is|call me)\s+"
+    r"(?P<name>([^\W\d_][^\W\d_.'-]*[.'-]?\s*){1,4})[\s.!]*$",
+    re.IGNORECASE
+)
+QUESTION_RE = re.compile(r"\?\s*$|^(why|what|how|who|where|when|which|do|does|can|could|is|are|should)\b",
+                         re.IGNORECASE)
+AGE_RE = re.compile(r"^(i am |i'm |my age is )?(\d{1,3})\s*(y|yr|yrs|year|years)?(\s*old)?[\s.]*$", re.IGNORECASE)
+BLOOD_GROUP_RE = re.compile(
+    r"^(my blood group is |it's |it is )?(A|B|AB|O)\s*(\+|-|\+ve|-ve|pos|neg|positive|negative)?[\s.]*$",
+    re.IGNORECASE
+)
+AFFIRMATIVE_RE = re.compile(
+    r"^(y|yes|yeah|yep|yup|ok|okay|correct|right|sure|confirm(ed)?|that's (right|correct)|all (good|correct))"
+    r"[\s.!]*$",
+    re.IGNORECASE
+)
+UNKNOWN_RE = re.compile(r"^(i )?(do not|don't|dont) know|^not sure|^unknown|^no idea", re.IGNORECASE)
+EMAIL_RE = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}$")
+DURATION_RE = re.compile(
+    r"\b(\d+|a|an|one|two|three|four|five|six|seven|few|couple of|several)\s*"
+    r"(min|mins|minutes?|hours?|hrs?|days?|weeks?|wks?|months?|years?|yrs?)\b"
+    r"|\b(since|yesterday|today|this morning|last night|last week|last month)\b",
+    re.IGNORECASE
+)
+
+def is_negative(answer: str) -> bool:
+    return bool(NEGATIVE_RE.match(answer.strip()))
+
+def is_affirmative(answer: str) -> bool:
+    return bool(AFFIRMATIVE_RE.match(answer.strip()))
+
+def validate_name(answer: str) -> RuleResult:
+    """Rejects replies that are plainly not a name; whether anything else is one is left to the LLM check."""
+    answer = answer.strip()
+    if is_negative(answer) or is_affirmative(answer) or UNKNOWN_RE.match(answer) or QUESTION_RE.search(answer):
+        return RuleResult(INVALID, "Please tell me your name so we can keep your consultation on record.")
+    return AMBIGUOUS_RESULT
+
+def parse_name(answer: str) -> str:
+    answer = answer.strip()
+    match = NAME_RE.match(answer)
+    return match.group("name").strip() if match else answer
+
+def parse_age(answer: str) -> Optional[int]:
+    match = AGE_RE.match(answer.strip())
+    if match and 0 < int(match.group(2)) <= 130:
+        return int(match.group(2))
+    return None
+
+def validate_age(answer: str) -> RuleResult:
+    if parse_age(answer) is not None:
+        return VALID_RESULT
+    return RuleResult(INVALID, "Please provide your age in years.")
+
+def validate_blood_group(answer: str) -> RuleResult:
+    answer = answer.strip()
+    if BLOOD_GROUP_RE.match(answer) or UNKNOWN_RE.match(answer):
+        return VALID_RESULT
+    return AMBIGUOUS_RESULT
+
+def validate_optional_list(answer: str) -> RuleResult:
+    """For yes/no questions that ask for a list: a plain negative needs no LLM check."""
+    return VALID_RESULT if is_negative(answer) else AMBIGUOUS_RESULT
+
+def validate_symptoms(answer: str) -> RuleResult:
+    if len(answer.split()) < 2:
+        return RuleResult(INVALID, "Please briefly describe what health issues you're experiencing.")
+    return VALID_RESULT
+
+def validate_duration(answer: str) -> RuleResult:
+    return VALID_RESULT if DURATION_RE.search(answer) else AMBIGUOUS_RESULT
+
+def validate_email(answer: str) -> RuleResult:
+    answer = answer.strip()
+    if EMAIL_RE.match(answer) or is_negative(answer):
+        return VALID_RESULT
+    if "@" in answer:
+        return RuleResult(INVALID, "Please enter a valid email address, or no/No.")
+    return AMBIGUOUS_RESULT
+
+def no_rule(answer: str) -> RuleResult:
+    """For questions with no local check: every answer goes to the LLM relevance check."""
+    return AMBIGUOUS_RESULT
+
+# Rules and answer parsers by the names questionnaire files use
+RULES: Dict[str, Rule] = {
+    "name": validate_name,
+    "age": validate_age,
+    "blood_group": validate_blood_group,
+    "optional_list": validate_optional_list,
+    "symptoms": validate_symptoms,
+    "duration": validate_duration,
+    "email": validate_email,
+    "none": no_rule,
+}
+PARSERS: Dict[str, Callable[[str], object]] = {
+    "text": str.strip,
+    "name": parse_name,
+    "age": parse_age,
+}
+# Predicates over an earlier answer, for conditional steps
+PREDICATES: Dict[str, Callable[[str], bool]] = {
+    "negative": is_negative,
+    "affirmative": is_affirmative,
+}
+
+class ValidatorRegistry:
+    """
+    Maps each question to a local rule. Only answers a rule marks as ambiguous
+    (or questions with no rule) need the LLM relevance check. Callers holding a
+    precompiled rule pass it to `check` and the registry only counts outcomes.
+    """
+
+    def __init__(self):
+        self.rules: Dict[str, Rule] = {}
+        self.counters = defaultdict(lambda: {VALID: 0, INVALID: 0, AMBIGUOUS: 0})
+
+    def register(self, question: str, rule: Rule):
+        self.rules[question] = rule
+
+    def check(self, question: str, answer: str, rule: Optional[Rule] = None) -> RuleResult:
+        rule = rule or self.rules.get(question)
+        result = rule(answer) if rule else AMBIGUOUS_RESULT
+        self.counters[question][result.verdict] += 1
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-question rule outcomes; `llm_avoided` counts answers decided without Gemini."""
+        return {
+            question: {
+                **counts,
+                "llm_avoided": counts[VALID] + counts[INVALID],
+            }
+            for question, counts in self.counters.items()
+        }
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_answer(answer: str) -> str:
+    return WHITESPACE_RE.sub(" ", answer.strip().lower()).rstrip(".!")
+
+def fingerprint(*parts: str) -> str:
+    """Short hash of the prompt text and model name; a change invalidates every cached verdict."""
+    return hashlib.sha1("\x00".join(parts).encode()).hexdigest()[:16]
+
+class VerdictCache:
+    """
+    Bounded LRU cache with TTL for LLM relevance verdicts, keyed on
+    (namespace, question, normalized answer). Optionally persisted to a JSON file.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 50000, ttl: float = 7 * 86400,
+                 path: Optional[str] = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # key -> (verdict, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            self.load()
+
+    def _key(self, question: str, answer: str) -> str:
+        return f"{self.namespace}\x00{question}\x00{normalize_answer(answer)}"
+
+    def get(self, question: str, answer: str) -> Optional[bool]:
+        key = self._key(question, answer)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        verdict, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return verdict
+
+    def put(self, question: str, answer: str, verdict: bool):
+        key = self._key(question, answer)
+        self._entries[key] = (verdict, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """Drop every entry; pass a new namespace when the prompt text or model changes."""
+        self._entries.clear()
+        if namespace is not None:
+            self.namespace = namespace
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable verdict cache {self.path}: {str(e)}")
+            return
+        if data.get("namespace") != self.namespace:
+            return
+        now = time.time()
+        for key, verdict, expires_at in data.get("entries", []):
+            if expires_at > now:
+                self._entries[key] = (verdict, expires_at)
+
+    def save(self):
+        if not self.path:
+            return
+        data = {
+            "namespace": self.namespace,
+            "entries": [[key, verdict, expires_at] for key, (verdict, expires_at) in self._entries.items()],
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,228 @@
+"""
+Outbound WhatsApp messages through the Twilio Messages REST API.
+
+Webhook replies stay TwiML; this gateway is for messages sent outside a reply
+(consultation summaries, expiry notices, follow-ups). Bodies longer than one
+WhatsApp message are split on sentence boundaries into labelled parts, sent one
+after another, and every send waits on two token buckets: one per recipient
+(WhatsApp throttles repeated messages to the same user) and one for the account's
+sender throughput. Twilio's 429s and 5xx responses are retried with backoff.
+"""
+import asyncio
+import random
+import re
+from collections import OrderedDict
+from typing import List, Optional
+
+import httpx
+
+from metrics import span
+from ratelimit import TokenBucket
+
+# Twilio rejects WhatsApp bodies over 1600 characters
+WHATSAPP_MAX_CHARS = 1600
+
+class DeliveryUnknown(RuntimeError):
+    """A request failed after it may have reached Twilio, so sending it again could duplicate the message."""
+
+# Where a sentence or paragraph ends; the whitespace after it stays with the earlier piece
+BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+|\n\s*")
+
+def _label(part: int, parts: int) -> str:
+    return f"({part}/{parts}) "
+
+def _pack(pieces: List[str], limit: int) -> List[str]:
+    """Greedily join consecutive pieces into chunks of at most `limit` characters."""
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece.rstrip()) > limit:
+            chunks.append(current.rstrip())
+            current = ""
+        text = piece.rstrip()
+        if len(text) > limit:
+            # A single sentence longer than a message: fall back to words, then to a hard cut
+            words = re.findall(r"\S+\s*", text)
+            if len(words) > 1:
+                split = _pack(words, limit)
+            else:
+                split = [text[i:i + limit] for i in range(0, len(text), limit)]
+            chunks.extend(split[:-1])
+            current = split[-1] + piece[len(text):]
+            continue
+        current += piece
+    if current.strip():
+        chunks.append(current.rstrip())
+    return chunks
+
+def split_message(body: str, limit: int = WHATSAPP_MAX_CHARS) -> List[str]:
+    """
+    Split `body` into parts of at most `limit` characters, breaking after sentences
+    or paragraphs where possible. Multi-part messages are prefixed "(1/3) ",
+    "(2/3) ", ... since WhatsApp does not guarantee they arrive in order.
+    """
+    body = body.strip()
+    if len(body) <= limit:
+        return [body]
+    pieces, start = [], 0
+    for match in BOUNDARY_RE.finditer(body):
+        pieces.append(body[start:match.end()])
+        start = match.end()
+    pieces.append(body[start:])
+
+    # Reserve room for the label; "(10/12) " is wider than "(1/3) ", so repack until it fits
+    width = len(_label(1, 1))
+    while True:
+        chunks = _pack(pieces, limit - width)
+        needed = len(_label(len(chunks), len(chunks)))
+        if needed <= width:
+            break
+        width = needed
+    return [_label(i, len(chunks)) + chunk for i, chunk in enumerate(chunks, 1)]
+
+class _Recipient:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate=rate, capacity=burst)
+        # Held for every part of a message, so two messages to one number never interleave
+        self.lock = asyncio.Lock()
+
+class WhatsAppGateway:
+    """
+    Async Twilio Messages client over a pooled keep-alive connection, opened on first
+    use. Point `base_url` at a local fake Twilio API for tests.
+
+    Rates are messages per second: `account_rate`/`account_burst` for the sending
+    number's throughput, `recipient_rate`/`recipient_burst` per destination number.
+    Recipients idle long enough to be evicted from the `max_recipients` LRU have a
+    full bucket anyway, so eviction never lets a burst through.
+    """
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, base_url: str = "https://api.twilio.com",
+                 account_rate: float = 80.0, account_burst: float = 80.0, recipient_rate: float = 1 / 6,
+                 recipient_burst: float = 5.0, max_chars: int = WHATSAPP_MAX_CHARS, max_attempts: int = 4,
+                 base_backoff: float = 0.5, max_backoff: float = 8.0, max_connections: int = 10,
+                 timeout: float = 10.0, max_recipients: int = 10000, transport: httpx.AsyncBaseTransport = None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.base_url = base_url
+        self.account_bucket = TokenBucket(rate=account_rate, capacity=account_burst)
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_chars = max_chars
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_recipients = max_recipients
+        self.transport = transport
+        self.client = None
+        self._recipients: "OrderedDict[str, _Recipient]" = OrderedDict()
+        self.messages = 0
+        self.parts = 0
+        self.retries = 0
+        self.failed = 0
+        self.throttled_seconds = 0.0
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            if not (self.account_sid and self.auth_token and self.from_number):
+                raise ValueError("TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER must be set")
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=(self.account_sid, self.auth_token),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=self.timeout,
+                transport=self.transport
+            )
+        return self.client
+
+    @staticmethod
+    def _address(number: str) -> str:
+        return number if number.startswith("whatsapp:") else f"whatsapp:{number}"
+
+    def _recipient(self, to: str) -> _Recipient:
+        recipient = self._recipients.get(to)
+        if recipient is None:
+            recipient = self._recipients[to] = _Recipient(self.recipient_rate, self.recipient_burst)
+            excess = len(self._recipients) - self.max_recipients
+            if excess > 0:
+                # Least recently used first, skipping numbers with a message in progress
+                idle = [key for key, r in self._recipients.items() if not r.lock.locked() and key != to]
+                for key in idle[:excess]:
+                    del self._recipients[key]
+        self._recipients.move_to_end(to)
+        return recipient
+
+    async def send(self, to: str, body: str, sent: Optional[List[str]] = None) -> List[str]:
+        """
+        Send `body` to `to` as one or more messages, in order; returns the Twilio
+        message SIDs. Each SID is appended to `sent` as soon as its part is accepted,
+        and parts already in `sent` are skipped, so a caller that keeps the list can
+        retry a failed send without repeating parts. Raises DeliveryUnknown when a
+        part may have been accepted anyway; retrying that could send it twice.
+        """
+        parts = split_message(body, self.max_chars)
+        recipient = self._recipient(to)
+        sids = sent if sent is not None else []
+        async with recipient.lock:
+            # The split is deterministic, so the same body resumes at the same part
+            for part in parts[len(sids):]:
+                # Waiting on the recipient first keeps one busy number from holding account tokens
+                self.throttled_seconds += await recipient.bucket.acquire()
+                self.throttled_seconds += await self.account_bucket.acquire()
+                with span("whatsapp_send"):
+                    sids.append(await self._create(to, part))
+                self.parts += 1
+        self.messages += 1
+        return sids
+
+    async def _create(self, to: str, body: str) -> str:
+        client = self.get_client()
+        data = {"From": self._address(self.from_number), "To": self._address(to), "Body": body}
+        path = f"/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after = None
+            try:
+                response = await client.post(path, data=data)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # The request never reached Twilio, so resending cannot duplicate the message
+                error = f"{type(e).__name__}: {str(e)}"
+            except httpx.TransportError as e:
+                # e.g. a read timeout: Twilio may have accepted the message
+                self.failed += 1
+                raise DeliveryUnknown(f"{type(e).__name__}: {str(e)}")
+            else:
+                if response.status_code in (200, 201):
+                    return response.json().get("sid", "")
+                error = f"Twilio returned {response.status_code}: {response.text[:200]}"
+                if response.status_code != 429 and response.status_code < 500:
+                    self.failed += 1
+                    raise RuntimeError(error)
+                retry_after = self._retry_after(response)
+            if attempt == self.max_attempts:
+                break
+            self.retries += 1
+            delay = min(self.max_backoff, self.base_backoff * (2 ** (attempt - 1)))
+            await asyncio.sleep(retry_after if retry_after is not None else delay + random.uniform(0, delay / 4))
+        self.failed += 1
+        raise RuntimeError(error)
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        try:
+            return min(self.max_backoff, max(0.0, float(response.headers["Retry-After"])))
+        except (KeyError, ValueError):
+            return None
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def stats(self) -> dict:
+        return {"messages": self.messages, "parts": self.parts, "retries": self.retries, "failed": self.failed,
+                "throttled_seconds": round(self.throttled_seconds, 3), "recipients": len(self._recipients)}